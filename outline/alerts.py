@@ -0,0 +1,137 @@
+"""
+alerts.py
+  Server-side alert deduplication and per-client rate limiting.
+
+  Producers (camera.py, breakin.py) emit every alert as soon as they see it.
+  The server collapses identical alerts from the same source and of the same
+  type within a window: the first one is broadcast immediately, repeats are
+  counted, and when the window closes a single summary such as
+  "neha is at the door! (x3)" goes out if anything was suppressed. Alerts a
+  client sends over its rate limit are counted too and reported with that
+  client's next broadcast alert, e.g. "... (+4 rate-limited)".
+"""
+
+import threading
+import time
+
+from metrics import REGISTRY
+
+ALERT_EVENTS = REGISTRY.counter("ping_server_alerts_total", "Alerts seen by the server, by outcome")
+
+
+class TokenBucket:
+    """Allows rate events per second on average, with bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def allow(self) -> bool:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class AlertCoalescer:
+    """
+    Args:
+        window: Seconds during which repeats of an alert are folded into one.
+        client_rate: Alerts per second each client may send on average.
+        client_burst: Alerts a client may send back to back.
+    """
+
+    def __init__(self, window: float = 30.0, client_rate: float = 2.0, client_burst: int = 10,
+                 clock=time.monotonic):
+        self.window = window
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._open = {}      # (source, type, message) -> [window start, count]
+        self._buckets = {}   # client id -> TokenBucket
+        self._dropped = {}   # client id -> rate-limited alerts not yet reported
+
+        self.emitted = 0
+        self.suppressed = 0
+        self.rate_limited = 0
+
+    def submit(self, client, source, alert_type, message) -> "str | None":
+        """
+        Records an incoming alert.
+
+        Returns:
+            str | None: The message to broadcast now, or None if it was folded
+            into an open window or the client is over its rate limit. Alerts
+            the client had rate-limited since its last broadcast are appended
+            as a count.
+        """
+        now = self.clock()
+        key = (source, alert_type, message)
+        with self._lock:
+            # Repeats are folded in first, so they neither spend the client's
+            # tokens nor go missing from the "(xN)" summary
+            entry = self._open.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed += 1
+                ALERT_EVENTS.inc(outcome="suppressed")
+                return None
+
+            # Only alerts that are about to be broadcast are charged
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst, self.clock)
+            if not bucket.allow():
+                self.rate_limited += 1
+                self._dropped[client] = self._dropped.get(client, 0) + 1
+                ALERT_EVENTS.inc(outcome="rate_limited")
+                return None
+
+            self._open[key] = [now, 1]
+            self.emitted += 1
+            ALERT_EVENTS.inc(outcome="emitted")
+            dropped = self._dropped.pop(client, 0)
+            return f"{message} (+{dropped} rate-limited)" if dropped else message
+
+    def flush(self):
+        """
+        Closes every window that has expired.
+
+        Returns:
+            list[tuple[str, str, str]]: (source, type, summary message) for each
+            closed window that folded in repeats.
+        """
+        now = self.clock()
+        summaries = []
+        with self._lock:
+            for key, (started, count) in list(self._open.items()):
+                if now - started >= self.window:
+                    del self._open[key]
+                    if count > 1:
+                        source, alert_type, message = key
+                        summaries.append((source, alert_type, f"{message} (x{count})"))
+                        self.emitted += 1
+                        ALERT_EVENTS.inc(outcome="emitted")
+        return summaries
+
+    def forget_client(self, client):
+        """Drops the rate-limit state of a disconnected client."""
+        with self._lock:
+            self._buckets.pop(client, None)
+            self._dropped.pop(client, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "emitted": self.emitted,
+                "suppressed": self.suppressed,
+                "rate_limited": self.rate_limited,
+                "open_windows": len(self._open),
+            }
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+  Per-stage latency benchmark for the recognition pipeline.
+
+  Replays every image in a directory through the same stages camera.main
+  runs (decode, colour conversion, face detection, face alignment + gallery
+  matching, person detection, occupation classification) and reports
+  p50/p95/p99 latency per stage, end-to-end throughput, cold-start vs warm
+  timings and peak RSS. The JSON report can be diffed against an earlier run:
+
+    python benchmark.py --images test-images --output bench.json
+    python benchmark.py --images test-images --compare bench.json
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+STAGES = ["decode", "color_convert", "face_detect", "face_recognize",
+          "person_detect", "occupation_classify"]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class StageTimer:
+    """Collects per-stage wall-clock samples in milliseconds."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def time(self, stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples[stage].append((time.perf_counter() - started) * 1000.0)
+        return result
+
+
+def summarize(samples) -> dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples)
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def run_frame(path: Path, timer: StageTimer, pipeline) -> dict:
+    """Runs one image through every stage, timing each. Returns what was found."""
+    import cv2
+
+    image = timer.time("decode", cv2.imread, str(path))
+    if image is None:
+        raise ValueError(f"Could not read {path}")
+
+    analysis = pipeline["FrameAnalysis"](image)
+    timer.time("color_convert", lambda: analysis.rgb)
+    faces = timer.time("face_detect", lambda: analysis.faces)
+
+    names = []
+    if faces:
+        names = timer.time("face_recognize",
+                           lambda: pipeline["predict_faces"](pipeline["align_faces"](analysis)))
+
+    persons = timer.time("person_detect", lambda: analysis.persons)
+    labels = []
+    if persons:
+        labels = timer.time("occupation_classify",
+                            lambda: pipeline["predict_people"]([analysis.crop(p) for p in persons]))
+
+    return {"faces": len(faces), "names": names, "persons": len(persons),
+            "labels": [label for label, _ in labels]}
+
+
+def run_benchmark(images_dir: Path, repeat: int = 3, cascade: bool = False) -> dict:
+    files = sorted(p for p in images_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not files:
+        raise SystemExit(f"No images found in {images_dir}")
+
+    # ---------- Cold start: imports and model loading ---------------------
+    cold = {}
+    started = time.perf_counter()
+    import detectors
+    from detect import FrameAnalysis, CascadeAnalysis, cascade_stats
+    from preprocess import align_faces
+    cold["import_detectors_ms"] = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    detectors.warm_up()
+    cold["warm_up_detectors_ms"] = (time.perf_counter() - started) * 1000.0
+
+    # Models load lazily, so each block forces its load rather than timing an import
+    started = time.perf_counter()
+    import known_model
+    known_model.get_gallery()
+    cold["load_gallery_ms"] = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    import gallery
+    gallery._facenet_model()
+    cold["load_facenet_ms"] = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    import unknown_model
+    unknown_model.load()
+    cold["load_classifier_ms"] = (time.perf_counter() - started) * 1000.0
+
+    pipeline = {
+        "FrameAnalysis": CascadeAnalysis if cascade else FrameAnalysis,
+        "align_faces": align_faces,
+        "predict_faces": known_model.predict_faces,
+        "predict_people": unknown_model.predict_people,
+    }
+
+    # The first frame still pays for lazy graph/kernel initialisation
+    first = StageTimer()
+    started = time.perf_counter()
+    run_frame(files[0], first, pipeline)
+    cold["first_frame_ms"] = (time.perf_counter() - started) * 1000.0
+    cold["first_frame_stages_ms"] = {s: round(v[0], 3) for s, v in first.samples.items() if v}
+    cold = {k: (round(v, 3) if isinstance(v, float) else v) for k, v in cold.items()}
+
+    # ---------- Warm runs ---------------------------------------------------
+    timer = StageTimer()
+    frame_ms = []
+    results = {}
+    for _ in range(repeat):
+        for path in files:
+            started = time.perf_counter()
+            results[path.name] = run_frame(path, timer, pipeline)
+            frame_ms.append((time.perf_counter() - started) * 1000.0)
+
+    total_s = sum(frame_ms) / 1000.0
+    return {
+        "meta": {
+            "images_dir": str(images_dir),
+            "images": len(files),
+            "repeat": repeat,
+            "cascade": cascade,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cold_start": cold,
+        "stages": {stage: summarize(samples) for stage, samples in timer.samples.items()},
+        "frame": summarize(frame_ms),
+        "throughput_fps": round(len(frame_ms) / total_s, 3) if total_s else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "results": results,
+        "cascade": cascade_stats() if cascade else None,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.10) -> bool:
+    """
+    Prints p50/p95 changes per stage against a baseline report.
+
+    Returns:
+        bool: True if any stage's p95 got slower by more than tolerance.
+    """
+    regressed = False
+    print(f"{'stage':<22}{'p50 base':>10}{'p50 now':>10}{'p95 base':>10}{'p95 now':>10}  change")
+    for stage in STAGES + ["frame"]:
+        now = report["stages"].get(stage) if stage != "frame" else report["frame"]
+        base = baseline["stages"].get(stage) if stage != "frame" else baseline.get("frame")
+        if not now or not base or not now.get("count") or not base.get("count"):
+            continue
+        change = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        regressed |= bool(flag)
+        print(f"{stage:<22}{base['p50_ms']:>10.2f}{now['p50_ms']:>10.2f}"
+              f"{base['p95_ms']:>10.2f}{now['p95_ms']:>10.2f}  {change:+.1%}{flag}")
+
+    for key in ("throughput_fps", "peak_rss_mb"):
+        print(f"{key}: {baseline.get(key)} -> {report.get(key)}")
+    changed = [name for name, r in report["results"].items() if baseline.get("results", {}).get(name, r) != r]
+    if changed:
+        print(f"Results changed for: {', '.join(changed)}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark")
+    parser.add_argument("--images", default="test-images", help="Directory of images to replay")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm passes over the directory")
+    parser.add_argument("--cascade", action="store_true", help="Use the coarse-to-fine detection cascade")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to diff against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p95 slowdown before flagging")
+    args = parser.parse_args()
+
+    report = run_benchmark(Path(args.images), repeat=args.repeat, cascade=args.cascade)
+
+    print(json.dumps({k: report[k] for k in ("cold_start", "frame", "throughput_fps", "peak_rss_mb", "cascade")},
+                     indent=2))
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            print(f"{stage:<22} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  (n={stats['count']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Saved report to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
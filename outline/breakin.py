@@ -1,40 +1,313 @@
-import random
+#!/usr/bin/env python3
+"""
+breakin.py
+  Streaming break-in detector for a distance / IR sensor.
+
+  Samples arrive in batches from a SensorSource (SimulatedSensor stands in
+  for real hardware) at hundreds of Hz. EwmaDetector keeps an exponentially
+  weighted mean and variance, O(1) memory, updated for a whole batch at a
+  time with numpy. Anomalous samples are held out of the statistics, so a
+  burst cannot inflate the variance and hide itself; from the first one on,
+  a batch is scored sample by sample. It flags a break-in when |z-score|
+  stays above a threshold for min_run consecutive samples, then stays quiet
+  until the signal has been normal for rearm samples. Alerts are handed to a
+  background AlertEmitter, so a slow or dropped server connection never
+  pauses sampling.
+
+  Usage:
+    python breakin.py --rate 200 --batch 50
+"""
+
+import argparse
+import math
+import queue
+import threading
 import time
+
+import numpy as np
 from socketio import Client
 
-# Connect to the WebSocket server
-socket = Client()
-socket.connect("http://localhost:5000")
+from metrics import ALERTS_SENT
 
-def simulate_sensor_reading():
-    """Returns a simulated sensor reading (e.g., distance or IR value)."""
-    # Normal baseline range is around 500 ± 10
-    return random.randint(300, 500)
 
-def is_unusual_pattern(prev, curr):
-    """Detects if the difference between readings is unusually high."""
-    return abs(curr - prev) > 100  # e.g., sudden spike/dip
+class SensorSource:
+    """Interface for anything that can stand in for the sensor."""
 
-def breakin_monitor():
-    print("Starting break-in monitor...")
+    def open(self):
+        pass
+
+    def read_batch(self, n: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Up to n float readings (fewer, or empty, if the source
+            has nothing more to give).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SimulatedSensor(SensorSource):
+    """
+    Baseline readings around 500 with Gaussian noise, plus occasional bursts
+    where the reading jumps (something crossing the sensor). Paced to rate_hz.
+    """
+
+    def __init__(self, rate_hz: float = 200.0, baseline: float = 500.0, noise: float = 10.0,
+                 burst_probability: float = 0.002, burst_length: int = 40,
+                 burst_offset: float = -150.0, seed: int = None):
+        self.rate_hz = rate_hz
+        self.baseline = baseline
+        self.noise = noise
+        self.burst_probability = burst_probability
+        self.burst_length = burst_length
+        self.burst_offset = burst_offset
+        self._rng = np.random.default_rng(seed)
+        self._burst_left = 0
+        self._next_time = None
+
+    def open(self):
+        self._next_time = time.monotonic()
+
+    def read_batch(self, n: int) -> np.ndarray:
+        # Wait until n samples' worth of time has passed, as real hardware would
+        self._next_time += n / self.rate_hz
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        readings = self.baseline + self._rng.normal(0.0, self.noise, n)
+        starts = np.flatnonzero(self._rng.random(n) < self.burst_probability)
+        offset = np.zeros(n)
+        if self._burst_left:
+            offset[:self._burst_left] = self.burst_offset
+        for start in starts:
+            offset[start:start + self.burst_length] = self.burst_offset
+        tail = [s + self.burst_length - n for s in starts] + [self._burst_left - n]
+        self._burst_left = max(0, *tail)
+        return readings + offset
+
+
+def _ewma(values: np.ndarray, alpha: float, start: float) -> np.ndarray:
+    """
+    Vectorised y[i] = (1 - alpha) * y[i-1] + alpha * values[i] with y[-1] = start.
+
+    Uses the closed form y[i] = d^(i+1) * start + alpha * d^i * sum_j<=i d^-j * values[j]
+    over chunks short enough that d^-j stays well inside float64 range.
+    """
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        return values.astype(np.float64)
+    chunk = max(1, int(27.0 / -math.log(decay)))  # d^-chunk <= ~1e12
+    out = np.empty(len(values), dtype=np.float64)
+    for lo in range(0, len(values), chunk):
+        x = values[lo:lo + chunk]
+        powers = decay ** np.arange(len(x))
+        out[lo:lo + len(x)] = decay * powers * start + alpha * powers * np.cumsum(x / powers)
+        start = out[lo + len(x) - 1]
+    return out
+
+
+class EwmaDetector:
+    """
+    Args:
+        alpha: EWMA weight of each new sample; ~2/alpha samples of memory.
+        z_threshold: |z-score| above which a sample is anomalous.
+        min_run: Consecutive anomalous samples needed to raise an alert.
+        rearm: Consecutive normal samples needed before the next alert.
+        warmup: Samples used to settle the statistics before alerting.
+        adapt_after: Anomalous samples in a row held out of the statistics
+            before the rest of the run is folded in, so a lasting level change
+            (sensor moved) becomes the new baseline. Defaults to rearm.
+    """
+
+    def __init__(self, alpha: float = 0.01, z_threshold: float = 4.0, min_run: int = 10,
+                 rearm: int = 200, warmup: int = 200, adapt_after: int = None):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_run = min_run
+        self.rearm = rearm
+        self.warmup = warmup
+        self.adapt_after = rearm if adapt_after is None else adapt_after
 
-    last_reading = simulate_sensor_reading()
-    time.sleep(0.5)
+        self.mean = None
+        self.var = 0.0
+        self.samples = 0
+        self._run = 0           # Current streak of anomalous samples
+        self._normal = rearm    # Current streak of normal samples
+        self._armed = True
+        self._held = 0          # Anomalous samples in a row kept out of the stats
 
-    while True:
-        reading = simulate_sensor_reading()
+    def update(self, values) -> list:
+        """
+        Folds a batch of readings into the statistics.
 
-        print(f"Sensor reading: {reading}")
-        
-        if is_unusual_pattern(last_reading, reading):
-            message = "Possible break-in detected!"
-            print("Alert sent:", message)
-            socket.emit("alert", {"message": message})
-            time.sleep(10)  # throttle alerting
-        else:
-            time.sleep(1)
+        Returns:
+            list[tuple[int, float]]: (index in values, z-score) of each sample
+            that raised an alert, usually empty.
+        """
+        x = np.asarray(values, dtype=np.float64).ravel()
+        if not len(x):
+            return []
+        if self.mean is None:
+            self.mean = float(x[0])
+
+        # Stats *before* each sample, so a sample is judged against its past.
+        # One vectorised pass is exact up to the first sample that must be held out.
+        means = _ewma(x, self.alpha, self.mean)
+        delta = x - np.concatenate(([self.mean], means[:-1]))
+        variances = _ewma((1.0 - self.alpha) * delta * delta, self.alpha, self.var)
+        prev_vars = np.concatenate(([self.var], variances[:-1]))
+        z = delta / np.sqrt(np.maximum(prev_vars, 1e-12))
+        anomalous = np.abs(z) > self.z_threshold
+        anomalous &= np.arange(self.samples, self.samples + len(x)) >= self.warmup
+
+        # A run already held out for adapt_after samples is folded in up to
+        # its next normal sample; any other anomalous sample is held out
+        hold = anomalous.copy()
+        if self._held >= self.adapt_after:
+            normal = np.flatnonzero(~anomalous)
+            hold[:normal[0] if len(normal) else len(x)] = False
+        hits = np.flatnonzero(hold)
+        k = int(hits[0]) if len(hits) else len(x)
+        if k:
+            self.mean = float(means[k - 1])
+            self.var = float(variances[k - 1])
+            self._held = self._held + k if anomalous[:k].all() else 0
+        if k < len(x):
+            self._step(x, k, z, anomalous)
+
+        self.samples += len(x)
+        return [(i, float(z[i])) for i in self._debounce(anomalous)]
+
+    def _step(self, x: np.ndarray, start: int, z: np.ndarray, anomalous: np.ndarray):
+        """
+        Scores x[start:] one sample at a time, holding anomalous samples out of
+        the statistics; fills in z and anomalous. O(1) per sample, used from
+        the first held-out sample of a batch on.
+        """
+        alpha, mean, var, held = self.alpha, self.mean, self.var, self._held
+        for i in range(start, len(x)):
+            delta = x[i] - mean
+            z[i] = delta / math.sqrt(max(var, 1e-12))
+            anomalous[i] = abs(z[i]) > self.z_threshold and self.samples + i >= self.warmup
+            if anomalous[i] and held < self.adapt_after:
+                held += 1
+                continue
+            mean += alpha * delta
+            var = (1.0 - alpha) * var + alpha * (1.0 - alpha) * delta * delta
+            held = held + 1 if anomalous[i] else 0
+        self.mean, self.var, self._held = float(mean), float(var), held
+
+    def _debounce(self, anomalous: np.ndarray) -> list:
+        """Indices where an anomalous streak reaches min_run while armed."""
+        alerts = []
+        # Walk the runs of equal flags rather than every sample
+        edges = np.flatnonzero(np.diff(anomalous.astype(np.int8))) + 1
+        bounds = np.concatenate(([0], edges, [len(anomalous)]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            length = int(hi - lo)
+            if anomalous[lo]:
+                self._normal = 0
+                if self._armed and self._run + length >= self.min_run:
+                    alerts.append(int(lo + self.min_run - self._run - 1))
+                    self._armed = False
+                self._run += length
+            else:
+                self._run = 0
+                self._normal += length
+                if self._normal >= self.rearm:
+                    self._armed = True
+        return alerts
+
+
+class AlertEmitter:
+    """
+    Sends alerts from a background thread. send() never blocks: if the queue
+    is full (server unreachable or slow), the alert is dropped and counted.
+    """
+
+    def __init__(self, socket, source: str = "breakin_sensor", max_pending: int = 16):
+        self.socket = socket
+        self.source = source
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="alert-emitter", daemon=True)
+        self._thread.start()
+
+    def send(self, message: str, alert_type: str = "breakin") -> bool:
+        try:
+            self._queue.put_nowait((message, alert_type))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            message, alert_type = item
+            try:
+                self.socket.emit("alert", {"message": message, "source": self.source, "type": alert_type})
+                ALERTS_SENT.inc(type=alert_type)
+                print("Alert sent:", message)
+            except Exception as e:
+                print("Error sending alert:", e)
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+
+
+def breakin_monitor(sensor: SensorSource, detector: EwmaDetector, emitter: AlertEmitter,
+                    batch: int = 50, report_seconds: float = 10.0):
+    print("Starting break-in monitor...")
+    sensor.open()
+    last_report = time.monotonic()
+    try:
+        while True:
+            readings = sensor.read_batch(batch)
+            if not len(readings):
+                break
+
+            for index, z in detector.update(readings):
+                print(f"Unusual reading {readings[index]:.1f} (z={z:+.1f})")
+                emitter.send("Possible break-in detected!")
+
+            if time.monotonic() - last_report >= report_seconds:
+                print(f"Sensor: {detector.samples} samples, mean {detector.mean:.1f}, "
+                      f"std {math.sqrt(detector.var):.1f}")
+                last_report = time.monotonic()
+    finally:
+        sensor.close()
 
-        last_reading = reading
 
 if __name__ == "__main__":
-    breakin_monitor()
+    parser = argparse.ArgumentParser(description="Ping break-in sensor monitor")
+    parser.add_argument("--rate", type=float, default=200.0, help="Sensor sample rate in Hz")
+    parser.add_argument("--batch", type=int, default=50, help="Samples read and scored per batch")
+    parser.add_argument("--alpha", type=float, default=0.01, help="EWMA weight of each new sample")
+    parser.add_argument("--z-threshold", type=float, default=4.0, help="|z-score| counted as unusual")
+    parser.add_argument("--min-run", type=int, default=10, help="Unusual samples in a row before alerting")
+    parser.add_argument("--rearm", type=int, default=200, help="Normal samples in a row before the next alert")
+    parser.add_argument("--source", default="breakin_sensor", help="Source name attached to alerts")
+    parser.add_argument("--server", default="http://localhost:8080", help="Socket.IO server to alert")
+    args = parser.parse_args()
+
+    # Connect to the WebSocket server
+    socket = Client()
+    socket.connect(args.server)
+
+    emitter = AlertEmitter(socket, source=args.source)
+    detector = EwmaDetector(alpha=args.alpha, z_threshold=args.z_threshold,
+                            min_run=args.min_run, rearm=args.rearm, warmup=int(2 / args.alpha))
+    try:
+        breakin_monitor(SimulatedSensor(rate_hz=args.rate), detector, emitter, batch=args.batch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emitter.stop()
+        socket.disconnect()
@@ -1,114 +1,152 @@
 #!/usr/bin/env python3
 """
 capture_and_alert.py
-  • Live mode  : grab a frame from PiCamera2 every loop
-  • Test mode  : grab a random image file from ./test-images
+  • Live mode  : stream frames from PiCamera2, always using the freshest one
+  • Test mode  : stream random image files from ./test-images
+  • Video mode : stream frames from a video file (--video)
 """
 
+from startup import STARTUP  # first, so the start-up report covers every import
+
 import argparse
-import os
-import random
+import threading
 import time
 from pathlib import Path
-import cv2
 
 from socketio import Client
 
 # --- your helpers -----------------------------------------------------------
-from detect import detect_face, detect_person
-from known_model import predict
-from unknown_model import predict_person
-
-# Optional (only needed in live mode)
-try:
-    from picamera2 import Picamera2
-except ImportError:
-    Picamera2 = None          # Avoid import error on non‑Pi dev machines
+from capture import StreamingCapture, open_source
+import detectors
+from motion import MotionGate
+from metrics import REGISTRY, STAGE_SECONDS, FRAMES_PROCESSED, FRAMES_SKIPPED, ALERTS_SENT
+from detect import FrameAnalysis, CascadeAnalysis, cascade_stats
+from tracker import TrackedRecognizer
+from recorder import EventRecorder
+import known_model
+from known_model import visitors_alert
+import unknown_model
+from unknown_model import occupation_alert
 # ---------------------------------------------------------------------------
 
+STARTUP.mark("imports")
+
+METRICS_PUSH_SECONDS = 10.0
+
+
+def main(test_mode: bool, test_dir: Path, video: str = None, fps: float = 10.0,
+         motion_threshold: float = 0.02, source: str = "front_door",
+         preload: bool = False, track_ttl: float = 30.0, record_dir: str = None,
+         pre_seconds: float = 5.0, post_seconds: float = 5.0, record_buffer_mb: float = 32.0,
+         cascade: bool = False):
+    # Recognition models load on first use; --preload loads them while the camera starts
+    if preload:
+        threading.Thread(target=lambda: (known_model.load(), unknown_model.load()),
+                         name="model-preload", daemon=True).start()
 
-def save_image(image: "ndarray", directory: str, prefix: str) -> str:
-    """Saves an image to the specified directory with a timestamp-based filename."""
-    if image is not None and image.size > 0:
-        os.makedirs(directory, exist_ok=True)
-        timestamp = int(time.time())
-        filename = f"{prefix}_{timestamp}.jpg"
-        filepath = os.path.join(directory, filename)
-        cv2.imwrite(filepath, image)
-        print(f"Saved image: {filepath}")
-        return filepath
-    return ""
-
-# Function to grab one frame from PiCamera2 and save it
-def get_frame_live() -> "ndarray | None":
-    """Grab one RGB frame from PiCamera2 and save it."""
-    if Picamera2 is None:
-        print("PiCamera2 not available on this machine.")
-        return None
-
-    picam2 = Picamera2()
-    picam2.preview_configuration.main.size = (640, 480)
-    picam2.preview_configuration.main.format = "RGB888"
-    picam2.preview_configuration.align()
-    picam2.configure("preview")
-    picam2.start()
-    frame = picam2.capture_array()
-    picam2.close()
-
-    # Save the image to a folder and return the filepath along with the image
-    if frame is not None:
-        filepath = save_image(frame, "captured_images", "live_frame")
-        return frame, filepath
-    return None, ""
-
-def get_frame_test(test_dir: Path) -> "ndarray | None":
-    """Pick a random image file (jpg/png) from test_dir and load it with cv2."""
-    files = [p for p in test_dir.iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png"}]
-    if not files:
-        print(f"No test images found in {test_dir}")
-        return None
-    img_path = random.choice(files)
-    print(f"[TEST MODE] Using {img_path}")
-    return img_path, cv2.imread(str(img_path))  # returns ndarray (BGR)
-
-
-def main(test_mode: bool, test_dir: Path):
     # --- connect socket -----------------------------------------------------
     socket = Client()
     socket.connect("http://localhost:8080")
 
-    get_frame = get_frame_test if test_mode else get_frame_live
-
-    while True:
-        img_path, image = get_frame(test_dir) if test_mode else get_frame()
-        if image is None:
-            time.sleep(5)
-            continue
-
-        # ---------- Face pipeline -------------------------------------------
-        if detect_face(image) != -1:
-            result = predict(img_path)
-            if result != "No matches found.":
-                msg = f"{result} is at the door!"
-                socket.emit("alert", {"message": msg})
-                print("Alert sent:", msg)
-                time.sleep(10)
+    # Keep the camera (or stand-in source) streaming in the background
+    capture = StreamingCapture(open_source(test_mode, test_dir, video), max_fps=fps)
+    capture.start()
+    STARTUP.mark("capture_started")
+
+    # Skip the heavy stages while the scene is static
+    gate = MotionGate(threshold=motion_threshold)
+
+    # Recognize each visitor once per track instead of on every frame
+    recognizer = TrackedRecognizer(ttl=track_ttl)
+
+    # Keep the last few seconds in memory and write a clip around each alert
+    recorder = None
+    if record_dir:
+        recorder = EventRecorder(record_dir, source=source, pre_seconds=pre_seconds,
+                                 post_seconds=post_seconds,
+                                 max_bytes=int(record_buffer_mb * 1024 * 1024)).start()
+
+    # Load every detector up front so the first frame runs at full speed
+    detectors.warm_up()
+    STARTUP.mark("detectors_ready")
+
+    last_push = time.monotonic()
+    try:
+        while True:
+            # Push this process's stats to the server's /metrics endpoint
+            if time.monotonic() - last_push >= METRICS_PUSH_SECONDS:
+                socket.emit("metrics", {"source": source, "metrics": REGISTRY.snapshot()})
+                last_push = time.monotonic()
+
+            frame = capture.read()
+            if frame is None:
+                if capture.exhausted.is_set():
+                    break
                 continue
-
-        # ---------- Person / occupation pipeline ---------------------------
-        if detect_person(image):
-            occ = predict_person(img_path)
-            if occ != "unknown":
-                msg = f"Unknown visitor! Identified as a {occ}."
-                socket.emit("alert", {"message": msg})
-                print("Alert sent:", msg)
-                time.sleep(5)
+            if recorder:
+                recorder.add(frame)
+            image = frame.image
+            with STAGE_SECONDS.time(stage="motion_gate"):
+                moved = gate.should_process(image)
+            if not moved:
+                FRAMES_SKIPPED.inc()
                 continue
-
-        # ---------- Fallback ------------------------------------------------
-        socket.emit("alert", {"message": "Unknown visitor!"})
-        print("Alert sent: Unknown visitor!")
-        time.sleep(5)
+            FRAMES_PROCESSED.inc()
+            STARTUP.mark("first_processed_frame")
+            if test_mode:
+                print(f"[TEST MODE] Using {frame.path}")
+
+            # One colour conversion and at most one pass of each detector per frame;
+            # the cascade looks at a downscaled frame first and zooms in on hits
+            analysis = CascadeAnalysis(image) if cascade else FrameAnalysis(image)
+
+            # ---------- Face pipeline ---------------------------------------
+            with STAGE_SECONDS.time(stage="face_detect"):
+                faces = analysis.faces
+            if faces:
+                with STAGE_SECONDS.time(stage="face_recognize"):
+                    msg = visitors_alert(recognizer.face_names(analysis))
+                alert_type = "known_visitor"
+                if msg:
+                    socket.emit("alert", {"message": msg, "source": source, "type": alert_type})
+                    print("Alert sent:", msg)
+                    if recorder:
+                        recorder.trigger(alert_type, image)
+                    STARTUP.mark("first_alert")
+                    ALERTS_SENT.inc(type=alert_type)
+                    continue
+
+            # ---------- Person / occupation pipeline -----------------------
+            with STAGE_SECONDS.time(stage="person_detect"):
+                persons = analysis.persons
+            if persons:
+                with STAGE_SECONDS.time(stage="occupation_classify"):
+                    msg = occupation_alert(recognizer.person_labels(analysis))
+                alert_type = "occupation"
+                if msg:
+                    socket.emit("alert", {"message": msg, "source": source, "type": alert_type})
+                    print("Alert sent:", msg)
+                    if recorder:
+                        recorder.trigger(alert_type, image)
+                    STARTUP.mark("first_alert")
+                    ALERTS_SENT.inc(type=alert_type)
+                    continue
+
+            # ---------- Fallback --------------------------------------------
+            socket.emit("alert", {"message": "Unknown visitor!", "source": source, "type": "unknown_visitor"})
+            print("Alert sent: Unknown visitor!")
+            if recorder:
+                recorder.trigger("unknown_visitor", image)
+            STARTUP.mark("first_alert")
+            ALERTS_SENT.inc(type="unknown_visitor")
+    finally:
+        print(f"Motion gate: {gate.frames_processed} frames processed, {gate.frames_skipped} skipped")
+        if cascade:
+            print("Detection cascade:", cascade_stats())
+        capture.stop()
+        if recorder:
+            recorder.stop()
+        detectors.shutdown()
 
 
 if __name__ == "__main__":
@@ -123,5 +161,79 @@ if __name__ == "__main__":
         default="test-images",
         help="Directory containing test images (used only with --test)",
     )
+    parser.add_argument(
+        "--video",
+        default=None,
+        help="Replay frames from a video file instead of the camera",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=10.0,
+        help="Maximum capture rate of the background frame producer",
+    )
+    parser.add_argument(
+        "--motion-threshold",
+        type=float,
+        default=0.02,
+        help="Fraction of the frame that must change before recognition runs",
+    )
+    parser.add_argument(
+        "--source",
+        default="front_door",
+        help="Camera name attached to every alert (the server deduplicates per source)",
+    )
+    parser.add_argument(
+        "--track-ttl",
+        type=float,
+        default=30.0,
+        help="Seconds a tracked visitor's identity/occupation is reused before re-running the models",
+    )
+    parser.add_argument(
+        "--pre-seconds",
+        type=float,
+        default=5.0,
+        help="Seconds of video kept from before each alert (with --record-dir)",
+    )
+    parser.add_argument(
+        "--post-seconds",
+        type=float,
+        default=5.0,
+        help="Seconds of video recorded after each alert (with --record-dir)",
+    )
+    parser.add_argument(
+        "--record-buffer-mb",
+        type=float,
+        default=32.0,
+        help="Memory budget for buffered compressed frames, in MB",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Detect on a downscaled frame first and at full resolution only where something was found",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Load the recognition models in the background at start-up instead of on first use",
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=STARTUP.budget,
+        help="Time-to-first-alert budget in seconds, checked in the start-up report",
+    )
+    parser.add_argument(
+        "--record-dir",
+        "--save-dir",
+        dest="record_dir",
+        default=None,
+        help="Write a clip and the triggering frame of every alert here",
+    )
     args = parser.parse_args()
-    main(test_mode=args.test, test_dir=Path(args.test_dir))
+    STARTUP.budget = args.startup_budget
+    main(test_mode=args.test, test_dir=Path(args.test_dir), video=args.video, fps=args.fps,
+         motion_threshold=args.motion_threshold,
+         source=args.source, preload=args.preload, track_ttl=args.track_ttl,
+         record_dir=args.record_dir, pre_seconds=args.pre_seconds, post_seconds=args.post_seconds,
+         record_buffer_mb=args.record_buffer_mb, cascade=args.cascade)
@@ -0,0 +1,256 @@
+"""
+capture.py
+  Continuous frame capture.
+
+  A background thread keeps a FrameSource open and pushes every frame into a
+  small ring buffer; consumers always take the freshest frame and anything
+  older is dropped. Keeping the camera open avoids the per-frame Picamera2
+  setup cost and preserves the sensor's auto-exposure state.
+
+  Sources:
+    • PiCameraSource  : Picamera2 preview stream (live mode)
+    • DirectorySource : image files from a directory (tests / replay)
+    • VideoFileSource : frames from a video file (tests / replay)
+"""
+
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from pathlib import Path
+
+import cv2
+
+# Optional (only needed in live mode)
+try:
+    from picamera2 import Picamera2
+except ImportError:
+    Picamera2 = None          # Avoid import error on non‑Pi dev machines
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# seq: capture counter, timestamp: time.time() at capture,
+# image: BGR ndarray, path: source file for file-backed sources, else None
+Frame = namedtuple("Frame", ["seq", "timestamp", "image", "path"])
+
+
+class FrameSource:
+    """Interface for anything that can stand in for the camera."""
+
+    def open(self):
+        pass
+
+    def read(self):
+        """
+        Returns:
+            tuple: (image, path) for the next frame, or (None, None) once the
+            source is exhausted.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PiCameraSource(FrameSource):
+    """Keeps one Picamera2 configured and running for the whole session."""
+
+    def __init__(self, size=(640, 480), camera: int = 0):
+        self.size = size
+        self.camera = camera   # Picamera2 camera_num, for boards with several cameras
+        self._picam2 = None
+
+    def open(self):
+        if Picamera2 is None:
+            raise RuntimeError("PiCamera2 not available on this machine.")
+        self._picam2 = Picamera2(camera_num=self.camera)
+        self._picam2.preview_configuration.main.size = self.size
+        self._picam2.preview_configuration.main.format = "RGB888"
+        self._picam2.preview_configuration.align()
+        self._picam2.configure("preview")
+        self._picam2.start()
+
+    def read(self):
+        return self._picam2.capture_array(), None
+
+    def close(self):
+        if self._picam2 is not None:
+            self._picam2.close()
+            self._picam2 = None
+
+
+class DirectorySource(FrameSource):
+    """Replays the image files in a directory, in name order or shuffled."""
+
+    def __init__(self, directory, loop: bool = True, shuffle: bool = False):
+        self.directory = Path(directory)
+        self.loop = loop
+        self.shuffle = shuffle
+        self._files = []
+        self._index = 0
+
+    def open(self):
+        self._files = sorted(p for p in self.directory.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not self._files:
+            raise RuntimeError(f"No test images found in {self.directory}")
+        self._index = 0
+
+    def read(self):
+        if self._index >= len(self._files):
+            if not self.loop:
+                return None, None
+            self._index = 0
+
+        if self.shuffle:
+            path = random.choice(self._files)
+        else:
+            path = self._files[self._index]
+        self._index += 1
+        return cv2.imread(str(path)), str(path)
+
+
+class VideoFileSource(FrameSource):
+    """Replays the frames of a video file through cv2.VideoCapture."""
+
+    def __init__(self, path, loop: bool = True):
+        self.path = str(path)
+        self.loop = loop
+        self._cap = None
+
+    def open(self):
+        self._cap = cv2.VideoCapture(self.path)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Could not open video {self.path}")
+
+    def read(self):
+        ok, image = self._cap.read()
+        if not ok and self.loop:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._cap.read()
+        return (image, None) if ok else (None, None)
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+class FrameRingBuffer:
+    """Bounded buffer of the most recent frames; the oldest is overwritten when full."""
+
+    def __init__(self, capacity: int = 4):
+        self._frames = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._last_read_seq = -1
+        self.dropped = 0
+
+    def put(self, frame: Frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                # About to overwrite a frame nobody has looked at yet
+                if self._frames[0].seq > self._last_read_seq:
+                    self.dropped += 1
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def latest(self, timeout: float = None) -> "Frame | None":
+        """
+        Waits for a frame newer than the last one returned and hands back the
+        freshest one. Anything older still in the buffer counts as dropped.
+        """
+        with self._cond:
+            has_new = lambda: self._frames and self._frames[-1].seq > self._last_read_seq
+            if not self._cond.wait_for(has_new, timeout):
+                return None
+            frame = self._frames[-1]
+            self.dropped += sum(1 for f in self._frames if self._last_read_seq < f.seq < frame.seq)
+            self._last_read_seq = frame.seq
+            return frame
+
+    def recent(self):
+        """Snapshot of every buffered frame, oldest first."""
+        with self._cond:
+            return list(self._frames)
+
+
+class StreamingCapture:
+    """
+    Background producer that keeps a FrameSource open and feeds a FrameRingBuffer.
+
+    Usage:
+        with StreamingCapture(PiCameraSource()) as capture:
+            frame = capture.read()
+    """
+
+    def __init__(self, source: FrameSource, capacity: int = 4, max_fps: float = None):
+        self.source = source
+        self.buffer = FrameRingBuffer(capacity)
+        self.max_fps = max_fps
+        self.frames_captured = 0
+        self.exhausted = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.source.open()
+        self._stop.clear()
+        self.exhausted.clear()
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        interval = 1.0 / self.max_fps if self.max_fps else 0.0
+        seq = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                image, path = self.source.read()
+            except Exception as e:
+                print("Error reading frame:", e)
+                if self._stop.wait(0.5):
+                    break
+                continue
+
+            if image is None:
+                self.exhausted.set()
+                break
+
+            self.buffer.put(Frame(seq, time.time(), image, path))
+            self.frames_captured += 1
+            seq += 1
+
+            if interval:
+                self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def read(self, timeout: float = 5.0) -> "Frame | None":
+        """Returns the freshest frame not yet read, or None on timeout / end of source."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.buffer.latest(timeout=0.1)
+            if frame is not None:
+                return frame
+            if self.exhausted.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                return None
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.source.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def open_source(test_mode: bool = False, test_dir="test-images", video: str = None) -> FrameSource:
+    """Picks the frame source the capture scripts' command-line flags ask for."""
+    if video:
+        return VideoFileSource(video)
+    if test_mode:
+        return DirectorySource(test_dir, shuffle=True)
+    return PiCameraSource()
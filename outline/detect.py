@@ -1,55 +1,330 @@
 import cv2
 import mediapipe as mp
 import numpy as np
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
 import argparse
 import os
+import threading
 import time
+from collections import namedtuple
 
-def detect_face(image: np.ndarray) -> float:
+import detectors
+from metrics import REGISTRY
+
+CASCADE_CHECKS = REGISTRY.counter("ping_cascade_checks_total",
+                                  "Detection cascade passes by kind, level (coarse/fine) and outcome (hit/miss)")
+
+# box: (x, y, w, h) in pixels, clipped to the frame
+# keypoints: for faces, ((x, y), ...) pixel coords of MediaPipe's six face
+#            keypoints, image-left eye first; None for person detections
+Detection = namedtuple("Detection", ["box", "score", "keypoints"], defaults=(None,))
+
+
+def _clip_box(x, y, w, h, width, height):
+    """Clips an (x, y, w, h) box to a width x height frame."""
+    x0, y0 = max(0, int(x)), max(0, int(y))
+    x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+class FrameAnalysis:
     """
-    Detects a face using MediaPipe Face Detection and returns the confidence score.
-    
-    Returns:
-        float: The confidence score if a face is detected, -1 if no face is detected.
+    Everything the pipeline learns about one frame, computed at most once.
+
+    The BGR->RGB conversion, face detection and person detection each run on
+    first access and are cached, so every stage that looks at the same frame
+    shares one pass of each detector. Crops are views into the original frame.
     """
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    mp_face_detection = mp.solutions.face_detection
+    def __init__(self, image: np.ndarray, min_face_confidence: float = 0.5,
+                 max_results: int = 5, score_threshold: float = 0.25):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.min_face_confidence = min_face_confidence
+        self.max_results = max_results
+        self.score_threshold = score_threshold
+
+        self._rgb = None
+        self._mp_image = None
+        self._faces = None
+        self._persons = None
+        self.detector_runs = 0
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def mp_image(self) -> "mp.Image":
+        if self._mp_image is None:
+            self._mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=self.rgb)
+        return self._mp_image
+
+    def _detect_faces(self, rgb: np.ndarray, offset=(0, 0), scale: float = 1.0,
+                      min_confidence: float = None):
+        """
+        Runs the face detector on rgb, a region of (or a downscaled copy of)
+        the frame, and maps the results into full-frame pixels: frame = offset
+        + region pixel / scale.
+        """
+        self.detector_runs += 1
+        confidence = self.min_face_confidence if min_confidence is None else min_confidence
+        results = detectors.face_detector(confidence).process(rgb)
+        h, w = rgb.shape[:2]
+        ox, oy = offset
+        faces = []
+        for detection in results.detections or []:
+            bbox = detection.location_data.relative_bounding_box
+            box = _clip_box(ox + bbox.xmin * w / scale, oy + bbox.ymin * h / scale,
+                            bbox.width * w / scale, bbox.height * h / scale,
+                            self.width, self.height)
+            keypoints = tuple(
+                (ox + kp.x * w / scale, oy + kp.y * h / scale)
+                for kp in detection.location_data.relative_keypoints
+            )
+            if box[2] and box[3]:
+                faces.append(Detection(box, float(detection.score[0]), keypoints or None))
+        return faces
 
-    with mp_face_detection.FaceDetection(min_detection_confidence=0.5) as face_detection:
-        results = face_detection.process(rgb_image)
+    def _detect_persons(self, rgb: np.ndarray, offset=(0, 0), scale: float = 1.0,
+                        score_threshold: float = None):
+        """Like _detect_faces, for person detections from the object detector."""
+        self.detector_runs += 1
+        threshold = self.score_threshold if score_threshold is None else score_threshold
+        detector = detectors.object_detector(self.max_results, threshold)
+        if rgb is self._rgb:
+            image = self.mp_image
+        else:
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(rgb))
+        ox, oy = offset
+        persons = []
+        for detection in detector.detect(image).detections:
+            category = detection.categories[0]
+            if category.category_name == "person":
+                bbox = detection.bounding_box
+                box = _clip_box(ox + bbox.origin_x / scale, oy + bbox.origin_y / scale,
+                                bbox.width / scale, bbox.height / scale,
+                                self.width, self.height)
+                if box[2] and box[3]:
+                    persons.append(Detection(box, float(category.score)))
+        return persons
 
-        if results.detections:
-            # Return the confidence score of the first detected face
-            return results.detections[0].score[0]  # Confidence score of the first detection
-        return -1.0  # No face detected, return -1
+    @property
+    def faces(self):
+        """Face detections, highest-scoring first."""
+        if self._faces is None:
+            self._faces = sorted(self._detect_faces(self.rgb), key=lambda d: d.score, reverse=True)
+        return self._faces
 
-def detect_person(image: np.ndarray, max_results: int = 5, score_threshold: float = 0.25) -> bool:
+    @property
+    def persons(self):
+        """Person detections from the object detector, highest-scoring first."""
+        if self._persons is None:
+            self._persons = sorted(self._detect_persons(self.rgb), key=lambda d: d.score, reverse=True)
+        return self._persons
+
+    def crop(self, detection: Detection) -> np.ndarray:
+        """View of the original BGR frame inside detection's box."""
+        x, y, w, h = detection.box
+        return self.image[y:y + h, x:x + w]
+
+
+def _merge_regions(boxes, margin: float, width: int, height: int):
+    """Grows each (x, y, w, h) box by margin and merges overlapping ones into (x0, y0, x1, y1) regions."""
+    regions = []
+    for x, y, w, h in boxes:
+        mx, my = w * margin, h * margin
+        regions.append([max(0, int(x - mx)), max(0, int(y - my)),
+                        min(width, int(x + w + mx)), min(height, int(y + h + my))])
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in regions if r[2] > r[0] and r[3] > r[1]]
+
+
+class CascadeAnalysis(FrameAnalysis):
     """
-    Detects a person using MediaPipe Object Detection.
-    
-    Returns:
-        bool: True if a person is detected, False otherwise.
+    FrameAnalysis that looks at a downscaled copy of the frame first.
+
+    Level 1 (coarse) runs the person and face detectors on a frame shrunk to
+    coarse_width pixels across, with lowered thresholds so that misses are
+    rare. Level 2 (fine) runs the full-resolution detectors only inside the
+    regions (plus margin) where level 1 found something: faces are searched
+    for around coarse faces and inside every coarse person box that has no
+    coarse face, where a face may be too small to see at the coarse scale.
+    Recognition then only ever sees level 2 detections. An empty frame costs
+    two detector passes on a small image and no full-resolution colour
+    conversion at all.
+    """
+
+    def __init__(self, image: np.ndarray, coarse_width: int = 320, coarse_face_confidence: float = 0.3,
+                 coarse_score_threshold: float = 0.15, margin: float = 0.25, **kwargs):
+        super().__init__(image, **kwargs)
+        self.scale = min(1.0, coarse_width / float(self.width))
+        self.coarse_face_confidence = coarse_face_confidence
+        self.coarse_score_threshold = coarse_score_threshold
+        self.margin = margin
+        self._coarse_rgb = None
+        self._coarse_faces = None
+        self._coarse_persons = None
+
+    @property
+    def coarse_rgb(self) -> np.ndarray:
+        if self._coarse_rgb is None:
+            size = (max(1, int(self.width * self.scale)), max(1, int(self.height * self.scale)))
+            small = cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+            self._coarse_rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        return self._coarse_rgb
+
+    @property
+    def coarse_faces(self):
+        if self._coarse_faces is None:
+            self._coarse_faces = self._detect_faces(self.coarse_rgb, scale=self.scale,
+                                                    min_confidence=self.coarse_face_confidence)
+            _count("face", "coarse", bool(self._coarse_faces))
+        return self._coarse_faces
+
+    @property
+    def coarse_persons(self):
+        if self._coarse_persons is None:
+            self._coarse_persons = self._detect_persons(self.coarse_rgb, scale=self.scale,
+                                                        score_threshold=self.coarse_score_threshold)
+            _count("person", "coarse", bool(self._coarse_persons))
+        return self._coarse_persons
+
+    def _region_rgb(self, region) -> np.ndarray:
+        x0, y0, x1, y1 = region
+        if self._rgb is not None:
+            return np.ascontiguousarray(self._rgb[y0:y1, x0:x1])
+        return cv2.cvtColor(self.image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+
+    def _fine(self, kind: str, boxes, detect):
+        """Runs detect at full resolution in each merged region around boxes; no boxes, no pass."""
+        if not boxes:
+            return []
+        detections = []
+        for region in _merge_regions(boxes, self.margin, self.width, self.height):
+            detections.extend(detect(self._region_rgb(region), offset=region[:2]))
+        _count(kind, "fine", bool(detections))
+        return _suppress(detections)
+
+    @property
+    def faces(self):
+        """Full-resolution face detections inside the coarse regions, highest-scoring first."""
+        if self._faces is None:
+            boxes = [d.box for d in self.coarse_faces]
+            # A second visitor's face may be too small for level 1 even when
+            # the first one's was found, so search every person without one
+            boxes += [p.box for p in self.coarse_persons
+                      if not any(_contains(p.box, face) for face in self.coarse_faces)]
+            self._faces = self._fine("face", boxes, self._detect_faces)
+        return self._faces
+
+    @property
+    def persons(self):
+        """Full-resolution person detections inside the coarse regions, highest-scoring first."""
+        if self._persons is None:
+            self._persons = self._fine("person", [d.box for d in self.coarse_persons], self._detect_persons)
+        return self._persons
+
+
+def _contains(box, detection) -> bool:
+    """True if detection's centre lies inside the (x, y, w, h) box."""
+    x, y, w, h = box
+    dx, dy, dw, dh = detection.box
+    cx, cy = dx + dw / 2, dy + dh / 2
+    return x <= cx <= x + w and y <= cy <= y + h
+
+
+def _suppress(detections, iou_threshold: float = 0.5):
+    """Drops detections overlapping a higher-scoring one (the same object seen from two regions)."""
+    kept = []
+    for det in sorted(detections, key=lambda d: d.score, reverse=True):
+        x, y, w, h = det.box
+        duplicate = False
+        for other in kept:
+            ox, oy, ow, oh = other.box
+            iw = min(x + w, ox + ow) - max(x, ox)
+            ih = min(y + h, oy + oh) - max(y, oy)
+            if iw > 0 and ih > 0 and iw * ih / float(w * h + ow * oh - iw * ih) > iou_threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(det)
+    return kept
+
+
+# kind -> level -> [checks, hits], for tuning the cascade (see cascade_stats)
+_cascade_counts = {}
+_cascade_lock = threading.Lock()   # Scheduler workers analyse frames concurrently
+
+
+def _count(kind: str, level: str, hit: bool):
+    with _cascade_lock:
+        counts = _cascade_counts.setdefault(kind, {}).setdefault(level, [0, 0])
+        counts[0] += 1
+        counts[1] += hit
+    CASCADE_CHECKS.inc(kind=kind, level=level, outcome="hit" if hit else "miss")
+
+
+def cascade_stats() -> dict:
     """
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
+    Per-level hit rates since start-up, e.g. {"face": {"coarse": {"checks":
+    120, "hits": 30, "hit_rate": 0.25}, "fine": {...}}}. A fine-level hit rate
+    well below 1.0 means the coarse thresholds escalate too eagerly.
+    """
+    with _cascade_lock:
+        counts = {kind: {level: tuple(c) for level, c in levels.items()} for kind, levels in _cascade_counts.items()}
+    return {
+        kind: {
+            level: {"checks": checks, "hits": hits, "hit_rate": round(hits / checks, 3) if checks else 0.0}
+            for level, (checks, hits) in levels.items()
+        }
+        for kind, levels in counts.items()
+    }
+
 
-    base_options = python.BaseOptions(model_asset_path="efficientdet_lite0.tflite")
-    options = vision.ObjectDetectorOptions(
-        base_options=base_options,
-        running_mode=vision.RunningMode.IMAGE,
-        max_results=max_results,
-        score_threshold=score_threshold
-    )
+def _as_analysis(image, cascade: bool = False, **kwargs) -> FrameAnalysis:
+    if isinstance(image, FrameAnalysis):
+        return image
+    return CascadeAnalysis(image, **kwargs) if cascade else FrameAnalysis(image, **kwargs)
 
-    detector = vision.ObjectDetector.create_from_options(options)
-    detection_result = detector.detect(mp_image)
 
-    for detection in detection_result.detections:
-        category = detection.categories[0]
-        if category.category_name == "person":
-            return True  # Person detected
+def detect_face(image, cascade: bool = False) -> float:
+    """
+    Detects a face using MediaPipe Face Detection and returns the confidence score.
+    image may be a BGR ndarray or a FrameAnalysis shared with other stages.
+    cascade=True checks a downscaled frame first (see CascadeAnalysis).
+
+    Returns:
+        float: The confidence score if a face is detected, -1 if no face is detected.
+    """
+    faces = _as_analysis(image, cascade=cascade).faces
+    if faces:
+        # Return the confidence score of the best detected face
+        return faces[0].score
+    return -1.0  # No face detected, return -1
+
+def detect_person(image, max_results: int = 5, score_threshold: float = 0.25,
+                  cascade: bool = False) -> bool:
+    """
+    Detects a person using MediaPipe Object Detection.
+    image may be a BGR ndarray or a FrameAnalysis shared with other stages.
+    cascade=True checks a downscaled frame first (see CascadeAnalysis).
 
-    return False  # No person detected
\ No newline at end of file
+    Returns:
+        bool: True if a person is detected, False otherwise.
+    """
+    frame = _as_analysis(image, cascade=cascade, max_results=max_results, score_threshold=score_threshold)
+    return bool(frame.persons)
@@ -0,0 +1,102 @@
+"""
+detectors.py
+  Process-wide registry of MediaPipe models.
+
+  Building a FaceDetection / FaceMesh graph or loading efficientdet_lite0.tflite
+  costs far more than running it on a 640x480 frame, so every model is built
+  once and reused. MediaPipe graphs are not safe to share between threads, so
+  each thread gets its own instance; shutdown() closes all of them.
+"""
+
+import threading
+
+import numpy as np
+import mediapipe as mp
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
+
+OBJECT_MODEL_PATH = "efficientdet_lite0.tflite"
+
+_local = threading.local()
+_lock = threading.Lock()
+_instances = []       # every model built on any thread, for shutdown()
+_generation = 0       # bumped by shutdown() so stale per-thread caches rebuild
+
+
+def _get(key, factory):
+    """Return this thread's cached model for key, building it on first use."""
+    cache = getattr(_local, "models", None)
+    if cache is None or getattr(_local, "generation", None) != _generation:
+        cache = _local.models = {}
+        _local.generation = _generation
+
+    model = cache.get(key)
+    if model is None:
+        model = factory()
+        cache[key] = model
+        with _lock:
+            _instances.append(model)
+    return model
+
+
+def face_detector(min_detection_confidence: float = 0.5):
+    """Shared mp.solutions FaceDetection for the calling thread."""
+    return _get(
+        ("face_detection", min_detection_confidence),
+        lambda: mp.solutions.face_detection.FaceDetection(
+            min_detection_confidence=min_detection_confidence
+        ),
+    )
+
+
+def face_mesh(max_num_faces: int = 1):
+    """Shared static-image mp.solutions FaceMesh for the calling thread."""
+    return _get(
+        ("face_mesh", max_num_faces),
+        lambda: mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True, max_num_faces=max_num_faces
+        ),
+    )
+
+
+def object_detector(max_results: int = 5, score_threshold: float = 0.25):
+    """Shared EfficientDet-Lite0 ObjectDetector for the calling thread."""
+    def build():
+        base_options = python.BaseOptions(model_asset_path=OBJECT_MODEL_PATH)
+        options = vision.ObjectDetectorOptions(
+            base_options=base_options,
+            running_mode=vision.RunningMode.IMAGE,
+            max_results=max_results,
+            score_threshold=score_threshold
+        )
+        return vision.ObjectDetector.create_from_options(options)
+
+    return _get(("object_detector", max_results, score_threshold), build)
+
+
+def warm_up(frame_size=(640, 480)):
+    """
+    Builds the default detectors for the calling thread and runs each once on a
+    blank frame, so the first real frame is processed at steady-state speed.
+    """
+    w, h = frame_size
+    blank = np.zeros((h, w, 3), dtype=np.uint8)
+
+    face_detector().process(blank)
+    face_mesh().process(blank)
+    object_detector().detect(mp.Image(image_format=mp.ImageFormat.SRGB, data=blank))
+
+
+def shutdown():
+    """Closes every model built so far; later calls rebuild them on demand."""
+    global _generation
+    with _lock:
+        instances = list(_instances)
+        _instances.clear()
+        _generation += 1
+
+    for model in instances:
+        try:
+            model.close()
+        except Exception as e:
+            print("Error closing detector:", e)
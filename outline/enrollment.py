@@ -0,0 +1,156 @@
+"""
+enrollment.py
+  Background enrollment of uploaded photos.
+
+  Decoding a large phone photo, downscaling it, writing it to
+  known_people_dataset/<name>/ and embedding it into the gallery all happen on
+  a small pool of worker threads fed by a bounded queue, so the Socket.IO
+  handlers in server.py return immediately. Deletions and renames go through
+  the same queue, since the first gallery access may have to build it. Each
+  job reports back through a notify(sid, payload) callback.
+"""
+
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from gallery import identity_dir
+
+MAX_SIDE = 1280        # Longest edge kept for enrolled photos
+JPEG_QUALITY = 90
+
+
+class EnrollmentJob:
+    def __init__(self, upload_id: str, name: str, data: bytes, sid: str = None):
+        self.upload_id = upload_id
+        self.name = name
+        self.data = data
+        self.sid = sid
+
+
+class PersonUpdateJob:
+    """Deletes the person called name, or renames them to new_name if given."""
+
+    def __init__(self, name: str, new_name: str = None, sid: str = None):
+        self.name = name
+        self.new_name = new_name
+        self.sid = sid
+
+
+class EnrollmentQueue:
+    """
+    Args:
+        gallery_getter: Returns the live FaceGallery to enroll into.
+        notify: Called as notify(sid, payload) with progress and results.
+        notify_update: Called as notify_update(sid, payload) for PersonUpdateJobs.
+        data_dir: Root of the <name>/<image> dataset tree.
+        max_pending: Jobs allowed to wait; submit() refuses beyond this.
+        workers: Number of worker threads.
+    """
+
+    def __init__(self, gallery_getter, notify, data_dir: str = "known_people_dataset",
+                 max_pending: int = 8, workers: int = 1, max_side: int = MAX_SIDE,
+                 notify_update=None):
+        self.gallery_getter = gallery_getter
+        self.notify = notify
+        self.notify_update = notify_update or notify
+        self.data_dir = data_dir
+        self.max_side = max_side
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"enrollment-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def depth(self) -> int:
+        """Jobs waiting to be processed."""
+        return self._jobs.qsize()
+
+    def submit(self, job) -> bool:
+        """Queues job without blocking. Returns False if the queue is full."""
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+    def stop(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if isinstance(job, PersonUpdateJob):
+                self._run_update(job)
+                continue
+            try:
+                self.notify(job.sid, self._process(job))
+            except Exception as e:
+                print("Error processing image upload:", e)
+                self.notify(job.sid, {'uploadId': job.upload_id, 'status': 'failed',
+                                      'message': 'Failed to process image.'})
+            finally:
+                self._jobs.task_done()
+
+    def _run_update(self, job: PersonUpdateJob):
+        try:
+            self.notify_update(job.sid, self._update(job))
+        except Exception as e:
+            print("Error updating person:", e)
+            self.notify_update(job.sid, {'status': 'failed', 'message': f"Failed to update {job.name}."})
+        finally:
+            self._jobs.task_done()
+
+    def _update(self, job: PersonUpdateJob) -> dict:
+        person_dir = identity_dir(job.name, self.data_dir)
+        if person_dir is None or not os.path.isdir(person_dir):
+            return {'status': 'failed', 'message': f"Unknown person: {job.name}"}
+
+        if job.new_name is None:
+            removed = self.gallery_getter().remove_identity(job.name)
+            shutil.rmtree(person_dir)
+            return {'status': 'done', 'message': f"Deleted {job.name} ({removed} faces)"}
+
+        new_dir = identity_dir(job.new_name, self.data_dir)
+        if new_dir is None:
+            return {'status': 'failed', 'message': 'Invalid name.'}
+        if os.path.lexists(new_dir):
+            return {'status': 'failed', 'message': f"{job.new_name} already exists"}
+        os.rename(person_dir, new_dir)
+        renamed = self.gallery_getter().rename_identity(job.name, job.new_name, self.data_dir)
+        return {'status': 'done', 'message': f"Renamed {job.name} to {job.new_name} ({renamed} faces)"}
+
+    def _process(self, job: EnrollmentJob) -> dict:
+        person_dir = identity_dir(job.name, self.data_dir)
+        if person_dir is None:
+            return {'uploadId': job.upload_id, 'status': 'failed', 'message': 'Invalid name.'}
+
+        image = Image.open(BytesIO(job.data))
+        image.draft("RGB", (self.max_side, self.max_side))  # Cheap JPEG downscale while decoding
+        image = image.convert("RGB")
+        image.thumbnail((self.max_side, self.max_side))
+
+        save_path = os.path.join(person_dir, f"{datetime.now().timestamp()}.jpg")
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        image.save(save_path, quality=JPEG_QUALITY)
+
+        # Embed the decoded pixels directly instead of re-reading the file
+        bgr = np.ascontiguousarray(np.asarray(image)[..., ::-1])
+        faces = self.gallery_getter().add_image(job.name, save_path, img=bgr)
+        if not faces:
+            print(f"No face found in upload for {job.name}")
+
+        return {'uploadId': job.upload_id, 'status': 'done', 'message': f"{save_path}", 'faces': faces}
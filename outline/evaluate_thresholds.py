@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+evaluate_thresholds.py
+  Offline evaluation of the recognizer's decision thresholds.
+
+  known_model.MATCH_THRESHOLD (Facenet cosine distance) and
+  unknown_model.CONFIDENCE_THRESHOLD (occupation softmax confidence) are
+  evaluated against labelled images. Faces are embedded by the gallery's own
+  gallery.embed_file and occupations are classified on detected person crops,
+  as camera.py does, so the numbers describe the pipeline that actually runs.
+  Embeddings and class probabilities are computed once and kept in the
+  content-addressed feature cache, so re-runs skip Facenet and TFLite
+  entirely. Every threshold sweep is then a few vectorised operations on
+  precomputed distance / probability matrices.
+
+  Face probes are labelled by directory (<probe-dir>/<identity>/<image>) or,
+  for a flat directory such as test-images, by file name with trailing digits
+  dropped (neha2.jpg -> neha). A probe whose identity is not enrolled is an
+  impostor that should match nobody. Occupation probes are labelled by file
+  name prefix (see quantize_classifier.EXPECTED_LABELS); any other image
+  should come out as Unknown.
+
+  Usage:
+    python evaluate_thresholds.py --probe-dir test-images --plot roc.png --output eval.json
+    python evaluate_thresholds.py --thresholds 0.3 0.35 0.4 0.45
+"""
+
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import gallery
+import known_model
+import unknown_model
+from detect import FrameAnalysis
+from feature_cache import FeatureCache, file_digest
+from quantize_classifier import expected_label
+
+# Optional (only needed for --plot)
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+NO_MATCH = "(no match)"
+
+
+# ---------- Labelled data --------------------------------------------------
+def list_probes(probe_dir: str):
+    """Yields (label, path) from <probe_dir>/<label>/<image>, or from file names in a flat directory."""
+    nested = list(gallery.list_images(probe_dir))
+    if nested:
+        yield from nested
+        return
+    for path in sorted(Path(probe_dir).iterdir()):
+        if path.suffix.lower() in gallery.IMAGE_EXTENSIONS:
+            yield re.sub(r"[\d_\-\s]+$", "", path.stem).lower(), str(path)
+
+
+def embed_labelled(items, cache: FeatureCache):
+    """
+    Embeds (label, path) pairs with gallery.embed_file, keeping the first (best
+    detected) face of each image.
+
+    Returns:
+        tuple: ((n, dim) normalised embeddings, labels, paths) for images with a face.
+    """
+    rows, labels, paths = [], [], []
+    for label, path in items:
+        faces = gallery.embed_file(path, cache)
+        if not len(faces):
+            print(f"No face found in {path}, skipping")
+            continue
+        rows.append(faces[0])
+        labels.append(label)
+        paths.append(path)
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), np.asarray([], dtype=str), paths
+    return gallery._normalize(np.asarray(rows, dtype=np.float32)), np.asarray(labels, dtype=str), paths
+
+
+# ---------- Face verification / identification -----------------------------
+def best_per_identity(distances: np.ndarray, identities: np.ndarray):
+    """
+    For each probe row, the closest identity and its distance, the same rule
+    as FaceGallery.search (each identity represented by its best image).
+
+    Returns:
+        tuple: (names, distances) arrays with one entry per probe.
+    """
+    names = np.unique(identities)
+    per_identity = np.stack([distances[:, identities == name].min(axis=1) for name in names], axis=1)
+    best = per_identity.argmin(axis=1)
+    return names[best], per_identity[np.arange(len(best)), best]
+
+
+def pair_scores(probe_emb, probe_labels, gallery_emb, gallery_identities, probe_paths=None, gallery_paths=None):
+    """
+    All probe-gallery cosine distances in one matrix product, split into
+    genuine (same identity) and impostor pairs. Pairs of an image with
+    itself (a probe that is also enrolled) are left out, and set to inf in
+    the returned matrix so identification cannot match a probe to itself.
+    """
+    distances = 1.0 - probe_emb @ gallery_emb.T
+    same = probe_labels[:, None] == gallery_identities[None, :]
+    valid = np.ones_like(same)
+    if probe_paths is not None and gallery_paths is not None:
+        valid = np.asarray(probe_paths)[:, None] != np.asarray(gallery_paths)[None, :]
+    genuine, impostor = distances[same & valid], distances[~same & valid]
+    distances[~valid] = np.inf
+    return distances, genuine, impostor
+
+
+def sweep(genuine: np.ndarray, impostor: np.ndarray, thresholds: np.ndarray) -> dict:
+    """
+    FAR (impostor pairs accepted) and FRR (genuine pairs rejected) at every
+    threshold, with accept meaning distance < threshold. Sorted arrays and
+    searchsorted make a sweep of thousands of thresholds effectively free.
+    """
+    genuine, impostor = np.sort(genuine), np.sort(impostor)
+    far = np.searchsorted(impostor, thresholds, side="left") / max(1, len(impostor))
+    frr = 1.0 - np.searchsorted(genuine, thresholds, side="left") / max(1, len(genuine))
+    eer_index = int(np.argmin(np.abs(far - frr)))
+    return {"thresholds": thresholds, "far": far, "frr": frr,
+            "eer": float((far[eer_index] + frr[eer_index]) / 2), "eer_threshold": float(thresholds[eer_index])}
+
+
+def identification(best_names, best_distances, probe_labels, enrolled, threshold: float) -> dict:
+    """
+    Applies known_model's decision rule at threshold and tallies the outcome
+    of every probe, plus a per-identity confusion table.
+    """
+    predicted = np.where(best_distances < threshold, best_names, NO_MATCH)
+    is_enrolled = np.isin(probe_labels, list(enrolled))
+
+    correct = is_enrolled & (predicted == probe_labels)
+    false_reject = is_enrolled & (predicted == NO_MATCH)
+    misidentified = is_enrolled & ~correct & ~false_reject
+    false_accept = ~is_enrolled & (predicted != NO_MATCH)
+
+    confusion = {}
+    for truth, guess in zip(probe_labels, predicted):
+        row = confusion.setdefault(str(truth) if truth in enrolled else "(not enrolled)", {})
+        row[str(guess)] = row.get(str(guess), 0) + 1
+
+    n_enrolled, n_impostor = int(is_enrolled.sum()), int((~is_enrolled).sum())
+    return {
+        "threshold": threshold,
+        "correct_rate": round(float(correct.sum()) / n_enrolled, 3) if n_enrolled else None,
+        "frr": round(float(false_reject.sum()) / n_enrolled, 3) if n_enrolled else None,
+        "misidentified_rate": round(float(misidentified.sum()) / n_enrolled, 3) if n_enrolled else None,
+        "far": round(float(false_accept.sum()) / n_impostor, 3) if n_impostor else None,
+        "confusion": confusion,
+    }
+
+
+# ---------- Occupation classifier ------------------------------------------
+def person_probabilities(path: str) -> np.ndarray:
+    """
+    Class probabilities of the most confident detected person in an image,
+    from the same person crops predict_people gets in camera.py. All zeros
+    (never accepted) if the image is unreadable or has no person.
+    """
+    image = cv2.imread(path)
+    if image is None:
+        print(f"Could not read {path}")
+        return np.zeros(len(unknown_model.LABELS), dtype=np.float32)
+    analysis = FrameAnalysis(image)
+    crops = [analysis.crop(person) for person in analysis.persons]
+    crops = [crop for crop in crops if crop.size]
+    if not crops:
+        return np.zeros(len(unknown_model.LABELS), dtype=np.float32)
+    probs = unknown_model._classify(unknown_model._prepare_batch(crops))
+    return probs[probs.max(axis=1).argmax()]
+
+
+def occupation_probabilities(paths, cache: FeatureCache) -> np.ndarray:
+    """(n, len(LABELS)) person_probabilities for each image, through the feature cache."""
+    probs = []
+    for path in paths:
+        digest = file_digest(path)
+        entry = cache.get(digest)
+        if entry is None:
+            entry = {"probs": person_probabilities(path)}
+            cache.put(digest, **entry)
+        probs.append(entry["probs"])
+    return np.asarray(probs, dtype=np.float32)
+
+
+def occupation_sweep(probs: np.ndarray, expected, thresholds: np.ndarray) -> dict:
+    """
+    Per threshold: how many occupation images get their correct label, how
+    many non-occupation images are correctly left Unknown, and how many get
+    a wrong occupation. All thresholds at once via broadcasting.
+    """
+    labels = np.asarray(unknown_model.LABELS)
+    best = probs.argmax(axis=1)
+    confidence = probs[np.arange(len(best)), best]
+    expected = np.asarray([e or "" for e in expected])
+    has_label = expected != ""
+    right_class = labels[best] == expected
+
+    accepted = confidence[None, :] >= thresholds[:, None]          # (thresholds, images)
+    correct = (accepted & right_class & has_label).sum(axis=1)
+    wrong = (accepted & ~right_class).sum(axis=1)
+    unknown_ok = (~accepted & ~has_label).sum(axis=1)
+    n_labelled, n_other = int(has_label.sum()), int((~has_label).sum())
+    return {
+        "thresholds": thresholds,
+        "recall": correct / max(1, n_labelled),
+        "wrong_label_rate": wrong / max(1, len(best)),
+        "unknown_rejection": unknown_ok / max(1, n_other),
+        "labelled": n_labelled,
+        "other": n_other,
+    }
+
+
+def plot_curves(face: dict, out_path: str):
+    if plt is None:
+        print("matplotlib is not installed; skipping --plot")
+        return
+    fig, (roc, det) = plt.subplots(1, 2, figsize=(11, 4.5))
+    roc.plot(face["far"], 1.0 - face["frr"])
+    roc.set_xlabel("False accept rate")
+    roc.set_ylabel("True accept rate")
+    roc.set_title("ROC (face verification)")
+    det.plot(face["far"], face["frr"])
+    det.set_xscale("log")
+    det.set_yscale("log")
+    det.set_xlabel("False accept rate")
+    det.set_ylabel("False reject rate")
+    det.set_title(f"DET (EER {face['eer']:.1%} at {face['eer_threshold']:.3f})")
+    for ax in (roc, det):
+        ax.grid(True, which="both", alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=120)
+    print(f"Saved curves to {out_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate face-match and occupation thresholds")
+    parser.add_argument("--data-dir", default=gallery.DATA_DIR, help="Enrolled <name>/<image> dataset")
+    parser.add_argument("--probe-dir", default="test-images", help="Labelled probe images")
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[0.3, 0.35, known_model.MATCH_THRESHOLD, 0.45, 0.5],
+                        help="Face distance thresholds to report FAR/FRR and confusion for")
+    parser.add_argument("--confidences", type=float, nargs="+",
+                        default=[0.5, 0.6, unknown_model.CONFIDENCE_THRESHOLD, 0.8, 0.9],
+                        help="Occupation confidence thresholds to report")
+    parser.add_argument("--no-occupation", action="store_true", help="Skip the occupation classifier")
+    parser.add_argument("--plot", default=None, help="Write ROC/DET curves to this image (needs matplotlib)")
+    parser.add_argument("--output", default=None, help="Write the full report as JSON here")
+    args = parser.parse_args()
+
+    cache = FeatureCache(gallery.CACHE_TAG)
+    enrolled = list(gallery.list_images(args.data_dir))
+    gallery_emb, gallery_ids, gallery_paths = embed_labelled(enrolled, cache)
+    probe_emb, probe_labels, probe_paths = embed_labelled(list_probes(args.probe_dir), cache)
+    print(f"{len(gallery_ids)} enrolled faces, {len(probe_labels)} probes "
+          f"(feature cache: {cache.hits} hits, {cache.misses} misses)")
+    if not len(gallery_ids) or not len(probe_labels):
+        raise SystemExit("Need at least one enrolled face and one probe with a face")
+
+    # ---------- Face: all pairs, ROC/DET, identification ------------------
+    distances, genuine, impostor = pair_scores(probe_emb, probe_labels, gallery_emb, gallery_ids,
+                                               probe_paths, gallery_paths)
+    curve = sweep(genuine, impostor, np.linspace(0.0, 2.0, 2001))
+    print(f"{len(genuine)} genuine / {len(impostor)} impostor pairs, "
+          f"EER {curve['eer']:.1%} at distance {curve['eer_threshold']:.3f}")
+
+    pairs = sweep(genuine, impostor, np.asarray(args.thresholds))
+    best_names, best_distances = best_per_identity(distances, gallery_ids)
+    enrolled_names = set(gallery_ids.tolist())
+    report = {"face": {"eer": curve["eer"], "eer_threshold": curve["eer_threshold"], "thresholds": []}}
+
+    fmt = lambda v: f"{v:.0%}" if v is not None else "-"
+    print(f"\n{'threshold':>10}{'pair FAR':>10}{'pair FRR':>10}{'id correct':>12}{'id FRR':>8}{'misid':>8}{'id FAR':>8}")
+    for i, threshold in enumerate(args.thresholds):
+        ident = identification(best_names, best_distances, probe_labels, enrolled_names, threshold)
+        marker = "  <- current" if threshold == known_model.MATCH_THRESHOLD else ""
+        print(f"{threshold:>10.3f}{pairs['far'][i]:>10.1%}{pairs['frr'][i]:>10.1%}{fmt(ident['correct_rate']):>12}"
+              f"{fmt(ident['frr']):>8}{fmt(ident['misidentified_rate']):>8}{fmt(ident['far']):>8}{marker}")
+        report["face"]["thresholds"].append(dict(ident, pair_far=float(pairs["far"][i]),
+                                                 pair_frr=float(pairs["frr"][i])))
+
+    current = next((t for t in report["face"]["thresholds"] if t["threshold"] == known_model.MATCH_THRESHOLD),
+                   report["face"]["thresholds"][0])
+    print(f"\nConfusion at {current['threshold']} (rows: truth, columns: prediction):")
+    for truth, row in sorted(current["confusion"].items()):
+        print(f"  {truth:<16}" + ", ".join(f"{guess}: {n}" for guess, n in sorted(row.items())))
+
+    if args.plot:
+        plot_curves(curve, args.plot)
+
+    # ---------- Occupation classifier -------------------------------------
+    if not args.no_occupation:
+        occupation_cache = FeatureCache(f"occupation-{os.path.basename(unknown_model.MODEL_PATH)}"
+                                        f"-v{unknown_model.PREPROCESS_VERSION}")
+        paths = [path for _, path in list_probes(args.probe_dir)]
+        probs = occupation_probabilities(paths, occupation_cache)
+        expected = [expected_label(Path(p)) for p in paths]
+        occ = occupation_sweep(probs, expected, np.asarray(args.confidences))
+        print(f"\nOccupation: {occ['labelled']} labelled images, {occ['other']} others")
+        print(f"{'confidence':>11}{'recall':>8}{'wrong':>8}{'unknown ok':>12}")
+        for i, threshold in enumerate(args.confidences):
+            marker = "  <- current" if threshold == unknown_model.CONFIDENCE_THRESHOLD else ""
+            print(f"{threshold:>11.2f}{occ['recall'][i]:>8.0%}{occ['wrong_label_rate'][i]:>8.0%}"
+                  f"{occ['unknown_rejection'][i]:>12.0%}{marker}")
+        report["occupation"] = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in occ.items()}
+
+    if args.output:
+        report["face"]["curve"] = {k: curve[k].tolist() for k in ("thresholds", "far", "frr")}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.output}")
@@ -0,0 +1,151 @@
+"""
+feature_cache.py
+  Content-addressed cache for per-image preprocessing and embedding results.
+
+  Entries are keyed by the SHA-256 of the source file's bytes and grouped under
+  a tag naming the model and preprocessing version that produced them, e.g.
+  "Facenet-mediapipe-chip-v2". Rebuilding the gallery or re-running
+  preprocessing/process_training.py only recomputes images whose bytes (or
+  whose tag) changed. Each producer caches the result it reuses: the gallery
+  stores embeddings (its aligned chips are cheap next to Facenet and never
+  read back), process_training.py stores aligned crops (it does not embed).
+  The cache is bounded: once it grows past max_bytes the least recently used
+  entries are evicted.
+
+  Usage:
+    python feature_cache.py --stats
+    python feature_cache.py --invalidate [--tag Facenet-mediapipe-chip-v2]
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+
+import numpy as np
+
+CACHE_DIR = ".feature_cache"
+MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """
+    Args:
+        tag: Model name + preprocessing version; entries from other tags never match.
+        root: Cache directory shared by all tags.
+        max_bytes: Size bound across all tags before LRU eviction kicks in.
+    """
+
+    def __init__(self, tag: str, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.tag = tag
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None   # lazily measured total size of root
+
+    def _entry_path(self, digest: str) -> str:
+        return os.path.join(self.root, self.tag, digest[:2], digest + ".npz")
+
+    def get(self, digest: str) -> "dict | None":
+        """
+        Returns the cached arrays for digest (e.g. {"crop": ..., "embedding": ...}),
+        or None on a miss.
+        """
+        path = self._entry_path(digest)
+        try:
+            with np.load(path) as data:
+                entry = {key: data[key] for key in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # Mark as recently used for eviction
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, digest: str, **arrays):
+        """Stores arrays (crop=..., embedding=...) for digest, then evicts if over budget."""
+        path = self._entry_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+            if self.size() > self.max_bytes:
+                self._evict()
+
+    def size(self) -> int:
+        """Total bytes used by the cache directory, across all tags."""
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def _entries(self, root: str = None):
+        """Yields (path, size, mtime) for every entry under root (default: the whole cache)."""
+        for dirpath, _, filenames in os.walk(root or self.root):
+            for filename in filenames:
+                if filename.endswith(".npz"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is 90% of max_bytes."""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+    def invalidate(self, all_tags: bool = False):
+        """Drops every entry for this tag (or the whole cache if all_tags)."""
+        with self._lock:
+            shutil.rmtree(self.root if all_tags else os.path.join(self.root, self.tag),
+                          ignore_errors=True)
+            self._size = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the feature cache")
+    parser.add_argument("--root", default=CACHE_DIR, help="Cache directory")
+    parser.add_argument("--tag", default=None, help="Only this tag (default: every tag)")
+    parser.add_argument("--invalidate", action="store_true", help="Delete cached entries")
+    parser.add_argument("--stats", action="store_true", help="Print entry counts and size")
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.tag or "", root=args.root)
+    if args.invalidate:
+        cache.invalidate(all_tags=args.tag is None)
+        print(f"Cleared {'tag ' + args.tag if args.tag else 'all entries'} in {args.root}")
+    if args.stats or not args.invalidate:
+        root = os.path.join(args.root, args.tag) if args.tag else args.root
+        entries = list(cache._entries(root))
+        print(f"{len(entries)} entries, {sum(e[1] for e in entries) / 1e6:.1f} MB in {root}")
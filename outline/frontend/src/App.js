@@ -4,6 +4,7 @@ import './App.css';
 
 // Connect to the WebSocket server
 const socket = io("http://localhost:8080");
+const UPLOAD_CHUNK_SIZE = 256 * 1024;
 
 function App() {
     const [alert, setAlert] = useState(null);
@@ -24,22 +25,21 @@ function App() {
         }
     };
 
-    const handleImageSubmit = () => {
+    const handleImageSubmit = async () => {
         if (!file || !name) {
             alert("Please select a file and enter a name.");
             return;
         }
 
-        const reader = new FileReader();
-        reader.onloadend = () => {
-            const base64Data = reader.result.split(',')[1];
-            socket.emit("upload_image_bytes", {
-                name,
-                imageData: base64Data
-            });
-            console.log("Image data sent");
-        };
-        reader.readAsDataURL(file);
+        // Send the raw bytes in binary chunks instead of one base64 string
+        const uploadId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        socket.emit("upload_image_start", { uploadId, name, size: file.size });
+        for (let offset = 0; offset < file.size; offset += UPLOAD_CHUNK_SIZE) {
+            const data = await file.slice(offset, offset + UPLOAD_CHUNK_SIZE).arrayBuffer();
+            socket.emit("upload_image_chunk", { uploadId, offset, data });
+        }
+        socket.emit("upload_image_end", { uploadId });
+        console.log("Image data sent");
     };
 
 
@@ -0,0 +1,436 @@
+"""
+gallery.py
+  Precomputed Facenet embeddings for everyone in known_people_dataset.
+
+  Every enrolled face is stored as one L2-normalised row of a contiguous
+  float32 matrix, with a parallel array of identities. A lookup is a single
+  matrix-vector product, so matching a visitor costs microseconds once the
+  gallery is built instead of a DeepFace.find walk over the dataset.
+
+  Enrolments, deletions and renames are applied incrementally: only the new
+  image is embedded, the arrays are swapped in under a lock and the on-disk
+  store is rewritten atomically, so other processes pick up the change on
+  their next lookup via FaceGallery.reload_if_changed().
+
+  The store is either a single .npz or, preferably, a packed directory (see
+  gallery_pack.py) whose embedding matrix is memory-mapped rather than read.
+"""
+
+import argparse
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import gallery_pack
+from feature_cache import FeatureCache, file_digest
+
+DATA_DIR = "known_people_dataset"
+STORE_PATH = os.path.join(DATA_DIR, "gallery_facenet.npz")
+PACK_PATH = os.path.join(DATA_DIR, "gallery.pack")
+MODEL_NAME = "Facenet"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# The stores (and their temp files) live in DATA_DIR next to the identities
+RESERVED_PREFIXES = (os.path.basename(STORE_PATH), os.path.basename(PACK_PATH))
+# Bump when detection/alignment settings change so cached embeddings (and
+# stores built with them) are not reused
+PREPROCESS_VERSION = 2
+CACHE_TAG = f"{MODEL_NAME}-mediapipe-chip-v{PREPROCESS_VERSION}"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalises vectors along the last axis."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-10)
+
+
+def embed_faces(img) -> np.ndarray:
+    """
+    Embeds every face in an image (path, BGR ndarray or detect.FrameAnalysis)
+    through the same pipeline as live queries: MediaPipe face detection,
+    aligned fixed-size chips (preprocess.align_faces) and one batched Facenet
+    pass (embed_face_crops). Enrolled and query faces are therefore cropped,
+    aligned and normalised identically, which MATCH_THRESHOLD relies on.
+
+    Returns:
+        np.ndarray: (n_faces, dim) float32 matrix, empty if no face is found.
+    """
+    from preprocess import align_faces  # Deferred: pulls in MediaPipe
+
+    if isinstance(img, (str, os.PathLike)):
+        path, img = str(img), cv2.imread(str(img))
+        if img is None:
+            print(f"Could not read {path}")
+            return np.empty((0, 0), dtype=np.float32)
+    return embed_face_crops(align_faces(img))
+
+
+def embed(img) -> "np.ndarray | None":
+    """Returns the embedding of the first face in img, or None if there is none."""
+    faces = embed_faces(img)
+    return faces[0] if len(faces) else None
+
+
+_facenet = None
+_facenet_lock = threading.Lock()
+
+
+def _facenet_model():
+    """DeepFace's Facenet client, built once per process even if several threads ask at once."""
+    global _facenet
+    if _facenet is None:
+        with _facenet_lock:
+            if _facenet is None:
+                from deepface import DeepFace  # Deferred: pulls in TensorFlow and Keras
+                _facenet = DeepFace.build_model(MODEL_NAME)
+    return _facenet
+
+
+def _fit_to(face: np.ndarray, target) -> np.ndarray:
+    """Scales face to fit target (h, w) and zero-pads the rest, as DeepFace does."""
+    th, tw = target
+    factor = min(th / face.shape[0], tw / face.shape[1])
+    size = (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor)))
+    resized = cv2.resize(face, size)
+    dh, dw = th - resized.shape[0], tw - resized.shape[1]
+    return np.pad(resized, ((dh // 2, dh - dh // 2), (dw // 2, dw - dw // 2), (0, 0)))
+
+
+def embed_face_crops(faces) -> np.ndarray:
+    """
+    Embeds already detected and aligned BGR face crops in one batched Facenet
+    forward pass, skipping DeepFace's per-image detection. Crops are fed as
+    BGR scaled to [0, 1], the channel order and normalisation
+    DeepFace.represent gives Facenet.
+
+    Returns:
+        np.ndarray: (len(faces), dim) float32 matrix.
+    """
+    if not len(faces):
+        return np.empty((0, 0), dtype=np.float32)
+    model = _facenet_model()
+    target = model.input_shape
+    batch = np.stack([_fit_to(face, target) for face in faces]).astype(np.float32) / 255.0
+    return np.asarray(model.model(batch, training=False), dtype=np.float32)
+
+
+def embed_file(path: str, cache: FeatureCache = None) -> np.ndarray:
+    """
+    embed_faces for an image file, served from the content-addressed cache when
+    the file's bytes have been embedded before. Images with no face are cached
+    too, so they are skipped on the next build as well.
+    """
+    if cache is None:
+        return embed_faces(path)
+
+    digest = file_digest(path)
+    entry = cache.get(digest)
+    if entry is not None:
+        return entry["embedding"]
+
+    faces = embed_faces(path)
+    cache.put(digest, embedding=faces)
+    return faces
+
+
+def list_images(data_dir: str = DATA_DIR):
+    """Yields (identity, path) for every image under data_dir/<identity>/."""
+    for identity in sorted(os.listdir(data_dir)):
+        person_dir = os.path.join(data_dir, identity)
+        if not os.path.isdir(person_dir):
+            continue
+        for filename in sorted(os.listdir(person_dir)):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield identity, os.path.join(person_dir, filename)
+
+
+def identity_dir(name, data_dir: str = DATA_DIR) -> "str | None":
+    """
+    data_dir/<name> for a client-supplied identity name, or None if the name
+    is not a single plain path component inside data_dir ("..", "a/b",
+    "/etc", a symlink pointing elsewhere, ...), starts with a dot or
+    collides with the gallery's own store files (RESERVED_PREFIXES).
+    """
+    if not isinstance(name, str) or not name.strip() or name.startswith("."):
+        return None
+    if name.startswith(RESERVED_PREFIXES):
+        return None
+    if os.sep in name or (os.altsep and os.altsep in name) or os.path.isabs(name) or "\0" in name:
+        return None
+    person_dir = os.path.join(data_dir, name)
+    root = os.path.realpath(data_dir)
+    if os.path.dirname(os.path.realpath(person_dir)) != root:
+        return None
+    return person_dir
+
+
+class FaceGallery:
+    """Embedding matrix of known faces with vectorised nearest-neighbour search."""
+
+    def __init__(self, embeddings: np.ndarray, identities, paths, normalized: bool = False):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.size and normalized:
+            self.embeddings = embeddings  # e.g. a read-only memmap of a pack; used as-is
+        elif embeddings.size:
+            self.embeddings = np.ascontiguousarray(_normalize(embeddings))
+        else:
+            self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.identities = np.asarray(identities, dtype=str)
+        self.paths = np.asarray(paths, dtype=str)
+        self.store_path = None
+        self.cache_tag = None   # Pipeline the embeddings came from, see CACHE_TAG
+        self._store_mtime = None
+        self._digests = {}    # path -> sha256, carried between pack rewrites
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.identities)
+
+    @classmethod
+    def build(cls, data_dir: str = DATA_DIR, use_cache: bool = True) -> "FaceGallery":
+        """
+        Embeds every image in data_dir. Images without a face are skipped.
+        Unchanged images are served from the feature cache unless use_cache is False.
+        """
+        cache = FeatureCache(CACHE_TAG) if use_cache else None
+        rows, identities, paths = [], [], []
+        for identity, path in list_images(data_dir):
+            faces = embed_file(path, cache)
+            if not len(faces):
+                print(f"No face found in {path}, skipping")
+                continue
+            rows.extend(faces)
+            identities.extend([identity] * len(faces))
+            paths.extend([path] * len(faces))
+        print(f"Built gallery with {len(rows)} faces from {data_dir}")
+        if cache is not None:
+            print(f"Feature cache: {cache.hits} hits, {cache.misses} misses")
+        gallery = cls(np.asarray(rows, dtype=np.float32), identities, paths)
+        gallery.cache_tag = CACHE_TAG
+        return gallery
+
+    @classmethod
+    def load(cls, store_path: str = STORE_PATH) -> "FaceGallery":
+        """Loads a .npz store, or maps a pack directory's embeddings without copying them."""
+        mtime = _store_mtime(store_path)
+        if os.path.isdir(store_path):
+            pack = gallery_pack.read_pack(store_path)
+            gallery = cls(pack["embeddings"], pack["identities"], pack["paths"], normalized=True)
+            gallery._digests = pack["digests"]
+            gallery.cache_tag = pack["index"].get("cache_tag")
+        else:
+            with np.load(store_path) as data:
+                gallery = cls(data["embeddings"], data["identities"], data["paths"])
+                gallery.cache_tag = str(data["cache_tag"]) if "cache_tag" in data.files else None
+        gallery.store_path = store_path
+        gallery._store_mtime = mtime
+        return gallery
+
+    def save(self, store_path: str = None):
+        """Writes the gallery to store_path atomically (temp file/directory + rename)."""
+        store_path = store_path or self.store_path or STORE_PATH
+        os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+        if store_path.endswith(".pack"):
+            # Chips and source blobs of the existing pack are carried over
+            self._digests = gallery_pack.write_pack(
+                store_path, self.embeddings, self.identities, self.paths, digests=self._digests,
+                meta={"model": MODEL_NAME, "cache_tag": self.cache_tag})
+        else:
+            tmp_path = store_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, embeddings=self.embeddings, identities=self.identities, paths=self.paths,
+                         cache_tag=np.asarray(self.cache_tag or ""))
+            os.replace(tmp_path, store_path)
+        self.store_path = store_path
+        self._store_mtime = _store_mtime(store_path)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Re-reads the on-disk store if another process has rewritten it.
+
+        Returns:
+            bool: True if the in-memory gallery was refreshed.
+        """
+        if self.store_path is None:
+            return False
+        try:
+            mtime = _store_mtime(self.store_path)
+        except FileNotFoundError:
+            return False
+        if mtime == self._store_mtime:
+            return False
+
+        try:
+            fresh = FaceGallery.load(self.store_path)
+        except FileNotFoundError:
+            return False  # A pack caught mid-replace; try again on the next lookup
+        with self._lock:
+            self._swap(fresh.embeddings, fresh.identities, fresh.paths)
+            self._digests = fresh._digests
+            self.cache_tag = fresh.cache_tag
+            self._store_mtime = fresh._store_mtime
+        return True
+
+    def _swap(self, embeddings, identities, paths):
+        """Replaces all three arrays together; caller must hold self._lock."""
+        self.embeddings = embeddings
+        self.identities = identities
+        self.paths = paths
+
+    def _keep(self, mask: np.ndarray):
+        """Keeps only the rows selected by mask; caller must hold self._lock."""
+        embeddings = self.embeddings[mask] if mask.any() else np.empty((0, 0), dtype=np.float32)
+        self._swap(np.ascontiguousarray(embeddings), self.identities[mask], self.paths[mask])
+
+    def add_image(self, identity: str, path: str, img=None) -> int:
+        """
+        Embeds a single newly enrolled image and appends its faces to the gallery.
+        img may be a BGR ndarray already in memory; otherwise path is read.
+
+        Returns:
+            int: Number of faces added (0 if no face was found).
+        """
+        faces = embed_faces(path if img is None else img)
+        if not len(faces):
+            print(f"No face found in {path}, not enrolled")
+            return 0
+        faces = _normalize(faces)
+
+        with self._lock:
+            if len(self):
+                embeddings = np.concatenate([self.embeddings, faces])
+            else:
+                embeddings = np.ascontiguousarray(faces)
+            self._swap(
+                embeddings,
+                np.concatenate([self.identities, np.asarray([identity] * len(faces), dtype=str)]),
+                np.concatenate([self.paths, np.asarray([path] * len(faces), dtype=str)]),
+            )
+            self.save()
+        return len(faces)
+
+    def remove_image(self, path: str) -> int:
+        """Drops every face that came from path. Returns the number removed."""
+        with self._lock:
+            mask = self.paths != path
+            removed = int((~mask).sum())
+            if removed:
+                self._keep(mask)
+                self.save()
+        return removed
+
+    def remove_identity(self, identity: str) -> int:
+        """Drops every face enrolled under identity. Returns the number removed."""
+        with self._lock:
+            mask = self.identities != identity
+            removed = int((~mask).sum())
+            if removed:
+                self._keep(mask)
+                self.save()
+        return removed
+
+    def rename_identity(self, old: str, new: str, data_dir: str = DATA_DIR) -> int:
+        """
+        Relabels old as new without re-embedding anything. Stored paths are
+        rewritten to match the renamed <data_dir>/<new>/ directory.
+        """
+        old_prefix = os.path.join(data_dir, old) + os.sep
+        new_prefix = os.path.join(data_dir, new) + os.sep
+        with self._lock:
+            mask = self.identities == old
+            renamed = int(mask.sum())
+            if renamed:
+                identities = self.identities.astype(object)
+                identities[mask] = new
+                paths = self.paths.astype(object)
+                paths[mask] = [
+                    new_prefix + p[len(old_prefix):] if p.startswith(old_prefix) else p
+                    for p in paths[mask]
+                ]
+                self._swap(self.embeddings, identities.astype(str), paths.astype(str))
+                self.save()
+        return renamed
+
+    def search(self, query: np.ndarray, top_k: int = 1):
+        """
+        Finds the top_k closest identities to a query embedding.
+
+        Returns:
+            list[tuple[str, float]]: (identity, cosine distance) pairs, closest
+            first, with each identity represented by its best-matching image.
+        """
+        with self._lock:
+            embeddings, identities = self.embeddings, self.identities
+        if not len(identities) or not embeddings.size:
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        distances = 1.0 - embeddings @ query
+
+        order = np.argsort(distances)
+        _, first = np.unique(identities[order], return_index=True)
+        best = order[np.sort(first)[:top_k]]
+        return [(str(identities[i]), float(distances[i])) for i in best]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 1):
+        """
+        Like search, for a (m, dim) matrix of queries matched with a single
+        matrix product.
+
+        Returns:
+            list[list[tuple[str, float]]]: One result list per query row.
+        """
+        with self._lock:
+            embeddings, identities = self.embeddings, self.identities
+        queries = np.asarray(queries, dtype=np.float32)
+        if not len(identities) or not embeddings.size or not queries.size:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[-1] != embeddings.shape[1]:
+            print(f"Query embeddings have {queries.shape[-1]} dims, gallery has {embeddings.shape[1]}")
+            return [[] for _ in range(len(queries))]
+        distances = 1.0 - _normalize(queries) @ embeddings.T
+
+        results = []
+        for row in distances:
+            order = np.argsort(row)
+            _, first = np.unique(identities[order], return_index=True)
+            best = order[np.sort(first)[:top_k]]
+            results.append([(str(identities[i]), float(row[i])) for i in best])
+        return results
+
+
+def _store_mtime(store_path: str) -> int:
+    """Modification time of a .npz store, or of a pack's index (rewritten last)."""
+    if os.path.isdir(store_path):
+        return os.stat(gallery_pack.index_path(store_path)).st_mtime_ns
+    return os.stat(store_path).st_mtime_ns
+
+
+def load_or_build(data_dir: str = DATA_DIR, store_path: str = STORE_PATH) -> FaceGallery:
+    """
+    Loads the stored gallery, building and saving it first if it is missing
+    or was embedded by a different pipeline (CACHE_TAG), since its distances
+    would not be comparable with live queries. A pack at PACK_PATH (see
+    gallery_pack.py) takes precedence over the .npz.
+    """
+    if store_path == STORE_PATH and os.path.isdir(PACK_PATH):
+        store_path = PACK_PATH
+    if os.path.exists(store_path):
+        gallery = FaceGallery.load(store_path)
+        if gallery.cache_tag == CACHE_TAG:
+            return gallery
+        print(f"{store_path} was built with {gallery.cache_tag or 'an older pipeline'}, rebuilding")
+    gallery = FaceGallery.build(data_dir)
+    gallery.save(store_path)
+    return gallery
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the known-face embedding gallery")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory of <name>/<image> files")
+    parser.add_argument("--store", default=STORE_PATH, help="Where to write the gallery")
+    parser.add_argument("--no-cache", action="store_true", help="Re-embed every image")
+    args = parser.parse_args()
+
+    FaceGallery.build(args.data_dir, use_cache=not args.no_cache).save(args.store)
+    print(f"Saved gallery to {args.store}")
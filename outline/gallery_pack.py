@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+gallery_pack.py
+  Packed, memory-mapped on-disk format for the known-face gallery.
+
+  A pack is a directory holding:
+    index.json      identity, source path and SHA-256 of every image, and
+                    which embedding rows / chip it owns
+    embeddings.npy  (n_faces, dim) float32, L2-normalised
+    chips.npy       (n_images, h, w, 3) uint8 aligned face chips (optional)
+    sources.bin     the original image files back to back (optional, so the
+                    pack can be unpacked into the exact directory tree)
+
+  The .npy files are opened with mmap_mode="r", so loading a gallery reads a
+  few kilobytes of JSON and maps the matrix without copying or decoding a
+  single image. A pack is replaced as a whole, never edited in place.
+
+  Usage:
+    python gallery_pack.py --data-dir known_people_dataset --pack known_people_dataset/gallery.pack --chips --sources
+    python gallery_pack.py --unpack known_people_dataset/gallery.pack --out-dir restored_dataset
+    python gallery_pack.py --info known_people_dataset/gallery.pack
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from feature_cache import file_digest
+
+PACK_VERSION = 1
+INDEX_NAME = "index.json"
+EMBEDDINGS_NAME = "embeddings.npy"
+CHIPS_NAME = "chips.npy"
+SOURCES_NAME = "sources.bin"
+
+
+def index_path(pack_dir: str) -> str:
+    """The file whose mtime tells readers the pack was replaced."""
+    return os.path.join(pack_dir, INDEX_NAME)
+
+
+def write_pack(pack_dir: str, embeddings: np.ndarray, identities, paths, digests: dict = None,
+               chips: dict = None, sources: bool = None, meta: dict = None) -> dict:
+    """
+    Writes a pack to pack_dir, replacing any existing one.
+
+    Args:
+        embeddings: (n_faces, dim) normalised rows; identities/paths are per row.
+        digests: Known {path: sha256}; missing ones are computed from the files.
+        chips: Optional {path: aligned chip}; all chips must have the same shape.
+            None keeps the chips of the existing pack, matched by sha256.
+        sources: Also copy every source file into sources.bin. None keeps
+            doing so if the existing pack has sources.bin: its bytes and
+            offsets are carried over and only new files are appended (space
+            of removed images is reclaimed by the next full pack_tree).
+        meta: Extra fields for the index (model name, preprocessing tag, ...).
+
+    Returns:
+        dict: {path: sha256} for every image in the pack.
+    """
+    digests = dict(digests or {})
+    tmp_dir = pack_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    images = {}   # path -> index entry, in first-seen order
+    for row, (identity, path) in enumerate(zip(identities, paths)):
+        identity, path = str(identity), str(path)
+        entry = images.get(path)
+        if entry is None:
+            if path not in digests and os.path.exists(path):
+                digests[path] = file_digest(path)
+            entry = images[path] = {"identity": identity, "path": path,
+                                    "sha256": digests.get(path, ""), "rows": []}
+        entry["rows"].append(row)
+
+    # What the pack being replaced already stores, by content
+    previous = {}
+    old_chips = None
+    old_sources = os.path.join(pack_dir, SOURCES_NAME)
+    if (chips is None or sources is None) and os.path.isdir(pack_dir):
+        try:
+            old = read_pack(pack_dir)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Not carrying over {pack_dir}: {e}")
+        else:
+            previous = {entry["sha256"]: entry for entry in old["index"]["images"] if entry["sha256"]}
+            old_chips = old["chips"] if chips is None else None
+    if sources is None:
+        sources = bool(previous) and os.path.exists(old_sources)
+    else:
+        old_sources = None   # Explicit: write sources.bin from scratch
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    np.save(os.path.join(tmp_dir, EMBEDDINGS_NAME), embeddings)
+
+    def chip_for(entry):
+        if chips and chips.get(entry["path"]) is not None:
+            return chips[entry["path"]]
+        prev = previous.get(entry["sha256"])
+        if old_chips is not None and prev is not None and "chip" in prev:
+            return old_chips[prev["chip"]]
+        return None
+
+    chip_shape = None
+    with_chip = [(entry, chip) for entry in images.values() for chip in [chip_for(entry)] if chip is not None]
+    if with_chip:
+        chip_shape = list(with_chip[0][1].shape)
+        with_chip = [(entry, chip) for entry, chip in with_chip if list(chip.shape) == chip_shape]
+        stack = np.lib.format.open_memmap(os.path.join(tmp_dir, CHIPS_NAME), mode="w+",
+                                          dtype=np.uint8, shape=(len(with_chip), *chip_shape))
+        for i, (entry, chip) in enumerate(with_chip):
+            stack[i] = chip
+            entry["chip"] = i
+        stack.flush()
+        del stack
+
+    if sources:
+        target = os.path.join(tmp_dir, SOURCES_NAME)
+        carried = old_sources is not None and os.path.exists(old_sources)
+        if carried:
+            shutil.copyfile(old_sources, target)
+        offset = os.path.getsize(target) if carried else 0
+        with open(target, "ab") as out:
+            for path, entry in images.items():
+                prev = previous.get(entry["sha256"])
+                if carried and prev is not None and "source" in prev:
+                    entry["source"] = prev["source"]
+                    continue
+                if not os.path.exists(path):
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                out.write(data)
+                entry["source"] = [offset, len(data)]
+                offset += len(data)
+
+    index = dict(meta or {}, version=PACK_VERSION, faces=len(embeddings),
+                 dim=int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                 chip_shape=chip_shape, images=list(images.values()))
+    with open(index_path(tmp_dir), "w") as f:
+        json.dump(index, f, indent=1)
+
+    # Swap the finished pack in; readers holding maps of the old files keep them
+    old_dir = pack_dir.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(pack_dir):
+        os.replace(pack_dir, old_dir)
+    os.replace(tmp_dir, pack_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return {path: entry["sha256"] for path, entry in images.items()}
+
+
+def read_pack(pack_dir: str, mmap: bool = True) -> dict:
+    """
+    Opens a pack without copying its arrays.
+
+    Returns:
+        dict: index (the parsed index.json), embeddings, identities and paths
+        (per embedding row), digests ({path: sha256}) and chips (or None).
+    """
+    with open(index_path(pack_dir)) as f:
+        index = json.load(f)
+    if index.get("version") != PACK_VERSION:
+        raise ValueError(f"{pack_dir}: unsupported pack version {index.get('version')}")
+
+    mode = "r" if mmap else None
+    embeddings = np.load(os.path.join(pack_dir, EMBEDDINGS_NAME), mmap_mode=mode)
+    identities = [""] * index["faces"]
+    paths = [""] * index["faces"]
+    for entry in index["images"]:
+        for row in entry["rows"]:
+            identities[row] = entry["identity"]
+            paths[row] = entry["path"]
+
+    chips_path = os.path.join(pack_dir, CHIPS_NAME)
+    chips = np.load(chips_path, mmap_mode=mode) if os.path.exists(chips_path) else None
+    return {
+        "index": index,
+        "embeddings": embeddings,
+        "identities": identities,
+        "paths": paths,
+        "digests": {entry["path"]: entry["sha256"] for entry in index["images"]},
+        "chips": chips,
+    }
+
+
+def pack_tree(data_dir: str, pack_dir: str, with_chips: bool = False, with_sources: bool = False,
+              use_cache: bool = True):
+    """Embeds data_dir (see FaceGallery.build) and writes it, optionally with chips and sources, as a pack."""
+    import gallery  # Deferred: gallery imports this module
+
+    faces = gallery.FaceGallery.build(data_dir, use_cache=use_cache)
+    chips = None
+    if with_chips:
+        import cv2
+        from preprocess import process_face_image
+
+        chips = {}
+        for path in dict.fromkeys(faces.paths):
+            image = cv2.imread(str(path))
+            chips[str(path)] = process_face_image(image) if image is not None else None
+
+    write_pack(pack_dir, faces.embeddings, faces.identities, faces.paths, chips=chips or {},
+               sources=with_sources, meta={"model": gallery.MODEL_NAME, "cache_tag": gallery.CACHE_TAG})
+    print(f"Packed {len(faces)} faces from {data_dir} into {pack_dir}")
+
+
+def unpack(pack_dir: str, out_dir: str) -> int:
+    """
+    Recreates the <identity>/<image> tree under out_dir. Images are restored
+    byte for byte from sources.bin (hash-checked) where the pack has them,
+    otherwise the aligned chip is written as a PNG.
+
+    Returns:
+        int: Number of files written.
+    """
+    data = read_pack(pack_dir)
+    sources_path = os.path.join(pack_dir, SOURCES_NAME)
+    sources = open(sources_path, "rb") if os.path.exists(sources_path) else None
+    written = 0
+    try:
+        for entry in data["index"]["images"]:
+            person_dir = os.path.join(out_dir, entry["identity"])
+            os.makedirs(person_dir, exist_ok=True)
+            filename = os.path.basename(entry["path"])
+
+            if "source" in entry and sources is not None:
+                offset, size = entry["source"]
+                sources.seek(offset)
+                blob = sources.read(size)
+                target = os.path.join(person_dir, filename)
+                with open(target, "wb") as f:
+                    f.write(blob)
+                if entry["sha256"] and file_digest(target) != entry["sha256"]:
+                    print(f"Warning: {target} does not match its recorded hash")
+            elif "chip" in entry and data["chips"] is not None:
+                import cv2
+                target = os.path.join(person_dir, os.path.splitext(filename)[0] + ".png")
+                cv2.imwrite(target, np.asarray(data["chips"][entry["chip"]]))
+            else:
+                print(f"No source or chip stored for {entry['path']}, skipping")
+                continue
+            written += 1
+    finally:
+        if sources is not None:
+            sources.close()
+    print(f"Unpacked {written} images from {pack_dir} into {out_dir}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the known-face dataset to and from a packed gallery")
+    parser.add_argument("--data-dir", default="known_people_dataset", help="Directory of <name>/<image> files")
+    parser.add_argument("--pack", default=os.path.join("known_people_dataset", "gallery.pack"),
+                        help="Pack directory to write")
+    parser.add_argument("--chips", action="store_true", help="Store an aligned face chip per image")
+    parser.add_argument("--sources", action="store_true", help="Store the original files for exact unpacking")
+    parser.add_argument("--no-cache", action="store_true", help="Re-embed every image")
+    parser.add_argument("--unpack", metavar="PACK", default=None, help="Pack to convert back into a tree")
+    parser.add_argument("--out-dir", default="unpacked_dataset", help="Where --unpack writes the tree")
+    parser.add_argument("--info", metavar="PACK", default=None, help="Print a pack's summary")
+    args = parser.parse_args()
+
+    if args.unpack:
+        unpack(args.unpack, args.out_dir)
+    elif args.info:
+        pack = read_pack(args.info)
+        index = pack["index"]
+        sizes = {name: os.path.getsize(os.path.join(args.info, name))
+                 for name in os.listdir(args.info)}
+        print(f"{args.info}: {index['faces']} faces x {index['dim']} dims, "
+              f"{len(index['images'])} images, {len(set(pack['identities']))} identities, "
+              f"chips {index['chip_shape']}")
+        for name, size in sorted(sizes.items()):
+            print(f"  {name:<16}{size / 1e6:8.2f} MB")
+    else:
+        pack_tree(args.data_dir, args.pack, with_chips=args.chips, with_sources=args.sources,
+                  use_cache=not args.no_cache)
@@ -1,22 +1,112 @@
 import os
-from deepface import DeepFace
-
-def predict(img_path):
-    """Model prediction using DeepFace Facenet model."""
-    print(f"Simulating prediction for: {img_path}")
-    data_dir = "known_people_dataset"
-    results = DeepFace.find(img_path=img_path, db_path=data_dir, model_name='Facenet')
-    # os.remove(img_path)
-
-    if results and not results[0].empty:
-        top_match = results[0].iloc[0]
-        match_path = top_match["identity"]
-        person_name = os.path.basename(os.path.dirname(match_path))
-        if float(top_match["distance"]) < 0.4:
-            print(top_match["distance"])
+import threading
+
+import cv2
+
+import gallery
+from metrics import RECOGNIZER_RESULTS
+
+# Cosine distance between aligned-chip embeddings. Carried over from the old
+# DeepFace.find path and not yet recalibrated: check it with evaluate_thresholds.py
+MATCH_THRESHOLD = 0.4
+
+_gallery = None
+_gallery_lock = threading.Lock()   # --preload thread and capture loop may both get here first
+
+
+def get_gallery():
+    """
+    Returns the shared known-face gallery, loading or building it on first use
+    and picking up enrolments other processes (server.py) have saved since.
+    """
+    global _gallery
+    if _gallery is None:
+        with _gallery_lock:
+            if _gallery is None:
+                _gallery = gallery.load_or_build()
+                return _gallery
+    _gallery.reload_if_changed()
+    return _gallery
+
+
+def load():
+    """Loads the gallery and the Facenet model now instead of on the first face."""
+    get_gallery()
+    gallery._facenet_model()
+
+
+def predict(image, is_face_crop: bool = False):
+    """
+    Model prediction using DeepFace Facenet model. image is a BGR ndarray
+    (e.g. a frame or a face crop), a detect.FrameAnalysis or a path to an
+    image file. The best face goes through the same chip alignment and
+    batched embedding as match_faces and gallery enrolment.
+
+    Pass is_face_crop=True for a crop of one face box from an earlier
+    detection pass (see detect.FrameAnalysis); the whole crop is then taken
+    as the face instead of detecting it a second time.
+    """
+    from detect import Detection, FrameAnalysis  # Deferred: pulls in MediaPipe
+    from preprocess import align_face_chip, align_faces
+
+    if isinstance(image, (str, os.PathLike)):
+        image = str(image)
+        print(f"Simulating prediction for: {image}")
+        image = cv2.imread(image)
+        if image is None:
+            return "No matches found."
+    if is_face_crop:
+        frame = FrameAnalysis(image)
+        faces = [align_face_chip(frame, Detection((0, 0, frame.width, frame.height), 1.0))]
+    else:
+        faces = align_faces(image)[:1]
+
+    for person_name, distance in match_faces(faces):
+        if person_name is not None:
+            print(distance)
             print(f"Prediction: {person_name}")
             return person_name
+    return "No matches found."
+
+
+def match_faces(faces):
+    """
+    Matches every face crop from a frame (see preprocess.align_faces) against the
+    gallery with one batched embedding pass and one gallery lookup.
+
+    Returns:
+        list: (name, cosine distance) for each face; name is None where nobody
+        was within MATCH_THRESHOLD.
+    """
+    if not len(faces):
+        return []
+    embeddings = gallery.embed_face_crops(faces)
+    results = []
+    for matches in get_gallery().search_batch(embeddings, top_k=1):
+        if matches and matches[0][1] < MATCH_THRESHOLD:
+            results.append(matches[0])
+            RECOGNIZER_RESULTS.inc(result="hit")
         else:
-            return "No matches found."
-    else:
-        return "No matches found."
+            results.append((None, matches[0][1] if matches else 2.0))
+            RECOGNIZER_RESULTS.inc(result="miss")
+    return results
+
+
+def predict_faces(faces):
+    """
+    Identifies every face crop from a frame, see match_faces.
+
+    Returns:
+        list: The matched name for each face, or None where nobody matched.
+    """
+    return [name for name, _ in match_faces(faces)]
+
+
+def visitors_alert(names) -> "str | None":
+    """Alert text for the recognised names, e.g. "neha and vy are at the door!"."""
+    known = list(dict.fromkeys(name for name in names if name))
+    if not known:
+        return None
+    if len(known) == 1:
+        return f"{known[0]} is at the door!"
+    return f"{', '.join(known[:-1])} and {known[-1]} are at the door!"
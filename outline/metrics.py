@@ -0,0 +1,193 @@
+"""
+metrics.py
+  Minimal in-process metrics with Prometheus text exposition.
+
+  Counters, gauges and histograms live in a Registry. Updating one is a dict
+  lookup and an add under a lock, cheap enough for the per-frame hot path.
+  server.py serves the registry at /metrics; capture processes push
+  Registry.snapshot() to the server over Socket.IO ("metrics" event), and the
+  server renders those snapshots with a source="<camera>" label.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+        return {"name": self.name, "type": self.type, "help": self.help, "samples": samples}
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock seconds spent inside the with-block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [
+                {"labels": dict(k), "counts": list(counts), "sum": total, "count": n}
+                for k, (counts, total, n) in self._values.items()
+            ]
+        return {"name": self.name, "type": self.type, "help": self.help,
+                "buckets": list(self.buckets), "samples": samples}
+
+
+def with_labels(snapshot, labels: dict) -> list:
+    """Copy of a snapshot with labels (e.g. {"source": "front_door"}) added to every sample."""
+    return [
+        dict(metric, samples=[dict(sample, labels=dict(sample["labels"], **labels))
+                              for sample in metric["samples"]])
+        for metric in snapshot
+    ]
+
+
+def render(snapshot) -> str:
+    """
+    Renders a Registry.snapshot() as Prometheus text. Families with the same
+    name (e.g. from several pushed snapshots) are merged under one header.
+    """
+    families = {}
+    for metric in snapshot:
+        family = families.get(metric["name"])
+        if family is None:
+            families[metric["name"]] = dict(metric, samples=list(metric["samples"]))
+        else:
+            family["samples"].extend(metric["samples"])
+
+    lines = []
+    for name, metric in families.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for sample in metric["samples"]:
+            labels = sample["labels"]
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {sample['value']}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], sample["counts"]):
+                cumulative += count
+                bucket_labels = sorted(dict(labels, le=bound).items())
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            base = _format_labels(sorted(labels.items()))
+            lines.append(f"{name}_sum{base} {sample['sum']}")
+            lines.append(f"{name}_count{base} {sample['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self) -> list:
+        """JSON-serialisable state of every metric, for pushing to the server."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [m.snapshot() for m in metrics]
+
+    def render(self) -> str:
+        return render(self.snapshot())
+
+
+REGISTRY = Registry()
+
+# ---------- Pipeline metrics shared by the capture loops ---------------------
+STAGE_SECONDS = REGISTRY.histogram("ping_stage_seconds", "Time spent in each pipeline stage")
+FRAMES_PROCESSED = REGISTRY.counter("ping_frames_processed_total", "Frames that ran the recognition pipeline")
+FRAMES_SKIPPED = REGISTRY.counter("ping_frames_skipped_total", "Frames skipped by the motion gate")
+FRAMES_DROPPED = REGISTRY.counter("ping_frames_dropped_total", "Frames dropped by the multi-camera scheduler under overload")
+ALERTS_SENT = REGISTRY.counter("ping_alerts_sent_total", "Alerts sent to the server, by type")
+RECOGNIZER_RESULTS = REGISTRY.counter("ping_recognizer_results_total", "Faces matched (hit) or not (miss) against the gallery")
@@ -0,0 +1,82 @@
+"""
+motion.py
+  Cheap change detector that gates the heavy recognition pipeline.
+
+  Each frame is shrunk to a thumbnail, converted to grayscale and compared
+  against a running-average background. Only when enough of the region of
+  interest has changed does the frame go on to face detection, DeepFace and
+  the occupation classifier; an empty, static porch costs one resize.
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Args:
+        threshold: Fraction of ROI pixels that must change to pass a frame.
+        pixel_threshold: Grayscale difference (0-255) for a pixel to count as changed.
+        size: Thumbnail (width, height) the comparison runs at.
+        alpha: Background learning rate; higher forgets static changes faster.
+        roi: Optional (x, y, w, h) in relative 0-1 coordinates to watch.
+    """
+
+    def __init__(self, threshold: float = 0.02, pixel_threshold: int = 25,
+                 size=(80, 60), alpha: float = 0.05, roi=None):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.size = size
+        self.alpha = alpha
+        self.roi = roi
+        self._background = None
+
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.last_score = 0.0
+
+    def _thumbnail(self, image: np.ndarray) -> np.ndarray:
+        small = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+
+        if self.roi is not None:
+            w, h = self.size
+            rx, ry, rw, rh = self.roi
+            small = small[int(ry * h):int((ry + rh) * h), int(rx * w):int((rx + rw) * w)]
+        return small.astype(np.float32)
+
+    def score(self, image: np.ndarray) -> float:
+        """
+        Updates the background with image and returns the fraction of ROI
+        pixels that differ from it (1.0 for the very first frame).
+        """
+        gray = self._thumbnail(image)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.copy()
+            return 1.0
+
+        diff = cv2.absdiff(gray, self._background)
+        cv2.accumulateWeighted(gray, self._background, self.alpha)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_process(self, image: np.ndarray) -> bool:
+        """True if the scene changed enough to run the heavy pipeline on image."""
+        self.last_score = self.score(image)
+        if self.last_score >= self.threshold:
+            self.frames_processed += 1
+            return True
+        self.frames_skipped += 1
+        return False
+
+    def reset(self):
+        """Forgets the background, so the next frame always passes."""
+        self._background = None
+
+    def stats(self) -> dict:
+        return {
+            "frames_processed": self.frames_processed,
+            "frames_skipped": self.frames_skipped,
+            "last_score": self.last_score,
+        }
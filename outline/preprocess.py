@@ -1,13 +1,13 @@
 import cv2
-import mediapipe as mp
 # from picamera2 import Picamera2
 import numpy as np
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
 import argparse
 import os
 import time
 
+import detectors
+from detect import FrameAnalysis
+
 def save_image(image: np.ndarray, directory: str, prefix: str):
     """Saves an image to the specified directory with a timestamp-based filename."""
     if image is not None and image.size > 0:
@@ -20,109 +20,208 @@ def save_image(image: np.ndarray, directory: str, prefix: str):
         return filepath
 
 
-def process_face_image(image):
+FACE_CHIP_SIZE = (160, 160)     # (width, height) of aligned chips; Facenet's input size
+LEFT_EYE, RIGHT_EYE = 33, 263   # FaceMesh landmarks of the image-left and image-right eye
+
+
+def process_face_image(image, save_dir: str = None, mode: str = "roi", size=FACE_CHIP_SIZE):
     """
     Detects and aligns a face using MediaPipe Face Detection and Face Mesh.
-    
+    image may be a BGR ndarray or a FrameAnalysis whose RGB conversion and face
+    detections are reused. If save_dir is given, the crop is also written there.
+
+    mode "roi" (default) runs FaceMesh on the detected face region only and
+    warps that region straight into a size chip (see align_face_chip).
+    mode "full_frame" is the original path: rotate the whole frame about its
+    centre and run face detection again to find the crop.
+
     Returns:
         np.ndarray: Cropped and aligned face image, or None if no face is detected.
     """
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-    mp_face_detection = mp.solutions.face_detection
-    mp_face_mesh = mp.solutions.face_mesh
-
-    with mp_face_detection.FaceDetection(min_detection_confidence=0.5) as face_detection, \
-         mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1) as face_mesh:
-        
-        results = face_detection.process(rgb_image)
-
-        if results.detections:
-            mesh_results = face_mesh.process(rgb_image)
-
-            if mesh_results.multi_face_landmarks:
-                for face_landmarks in mesh_results.multi_face_landmarks:
-                    left_eye = face_landmarks.landmark[33]
-                    right_eye = face_landmarks.landmark[263]
-
-                    h, w, _ = image.shape
-                    left_eye_coords = (int(left_eye.x * w), int(left_eye.y * h))
-                    right_eye_coords = (int(right_eye.x * w), int(right_eye.y * h))
-
-                    delta_y = right_eye_coords[1] - left_eye_coords[1]
-                    delta_x = right_eye_coords[0] - left_eye_coords[0]
-                    angle = np.degrees(np.arctan2(delta_y, delta_x))
-
-                    center = (w // 2, h // 2)
-                    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-                    rotated_image = cv2.warpAffine(image, rotation_matrix, (w, h))
-
-                    rotated_rgb_image = cv2.cvtColor(rotated_image, cv2.COLOR_BGR2RGB)
-                    rotated_results = face_detection.process(rotated_rgb_image)
-
-                    if rotated_results.detections:
-                        for rotated_detection in rotated_results.detections:
-                            bbox = rotated_detection.location_data.relative_bounding_box
-                            x, y, w_box, h_box = (
-                                max(0, int(bbox.xmin * w)), 
-                                max(0, int(bbox.ymin * h)), 
-                                min(w, int(bbox.width * w)), 
-                                min(h, int(bbox.height * h))
-                            )
-
-                            cropped_face = rotated_image[y:y + h_box, x:x + w_box]
-                            if cropped_face.size > 0:
-                                return save_image(cropped_face, "faces", "face")
-                            return None
-
-                    print("Face not detected in rotated image.")
-                    return None
-
-                print("Face landmarks not detected.")
-                return None
+    frame = image if isinstance(image, FrameAnalysis) else FrameAnalysis(image)
+    if mode == "full_frame":
+        return _process_face_image_full_frame(frame, save_dir)
 
+    if not frame.faces:
         print("No face detected.")
         return None
+    chip = align_face_chip(frame, frame.faces[0], size=size)
+    if save_dir:
+        save_image(chip, save_dir, "face")
+    return chip
+
+def _process_face_image_full_frame(frame: FrameAnalysis, save_dir: str = None):
+    """Rotates the whole frame about its centre, then detects the face again to crop it."""
+    image, rgb_image = frame.image, frame.rgb
+
+    face_detection = detectors.face_detector()
+    face_mesh = detectors.face_mesh()
+
+    if frame.faces:
+        mesh_results = face_mesh.process(rgb_image)
+
+        if mesh_results.multi_face_landmarks:
+            for face_landmarks in mesh_results.multi_face_landmarks:
+                left_eye = face_landmarks.landmark[33]
+                right_eye = face_landmarks.landmark[263]
+
+                h, w, _ = image.shape
+                left_eye_coords = (int(left_eye.x * w), int(left_eye.y * h))
+                right_eye_coords = (int(right_eye.x * w), int(right_eye.y * h))
+
+                delta_y = right_eye_coords[1] - left_eye_coords[1]
+                delta_x = right_eye_coords[0] - left_eye_coords[0]
+                angle = np.degrees(np.arctan2(delta_y, delta_x))
+
+                center = (w // 2, h // 2)
+                rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+                rotated_image = cv2.warpAffine(image, rotation_matrix, (w, h))
+
+                rotated_rgb_image = cv2.cvtColor(rotated_image, cv2.COLOR_BGR2RGB)
+                rotated_results = face_detection.process(rotated_rgb_image)
+
+                if rotated_results.detections:
+                    for rotated_detection in rotated_results.detections:
+                        bbox = rotated_detection.location_data.relative_bounding_box
+                        x, y, w_box, h_box = (
+                            max(0, int(bbox.xmin * w)), 
+                            max(0, int(bbox.ymin * h)), 
+                            min(w, int(bbox.width * w)), 
+                            min(h, int(bbox.height * h))
+                        )
+
+                        cropped_face = rotated_image[y:y + h_box, x:x + w_box]
+                        if cropped_face.size > 0:
+                            if save_dir:
+                                save_image(cropped_face, save_dir, "face")
+                            return cropped_face
+                        return None
+
+                print("Face not detected in rotated image.")
+                return None
 
-def detect_and_crop_person(image: np.ndarray, max_results: int = 5, score_threshold: float = 0.25) -> np.ndarray:
+            print("Face landmarks not detected.")
+            return None
+
+    print("No face detected.")
+    return None
+
+def _margin_box(box, margin: float, width: int, height: int):
+    """(x0, y0, x1, y1) of box grown by margin on every side, clipped to the frame."""
+    x, y, w, h = box
+    mx, my = int(w * margin), int(h * margin)
+    return max(0, x - mx), max(0, y - my), min(width, x + w + mx), min(height, y + h + my)
+
+def mesh_eye_centers(rgb: np.ndarray, box, margin: float = 0.2, face_mesh=None):
     """
-    Detects a person using MediaPipe Object Detector and returns a cropped image.
-    
+    Runs FaceMesh on the face region of an RGB frame only.
+
     Returns:
-        np.ndarray: Cropped person image, or None if no person is detected.
+        tuple: ((lx, ly), (rx, ry)) eye positions in frame pixels, image-left
+        eye first, or None if FaceMesh finds no face in the region.
     """
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
-
-    base_options = python.BaseOptions(model_asset_path="efficientdet_lite0.tflite")
-    options = vision.ObjectDetectorOptions(
-        base_options=base_options,
-        running_mode=vision.RunningMode.IMAGE,
-        max_results=max_results,
-        score_threshold=score_threshold
+    x0, y0, x1, y1 = _margin_box(box, margin, rgb.shape[1], rgb.shape[0])
+    roi = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+    if roi.size == 0:
+        return None
+    results = (face_mesh or detectors.face_mesh()).process(roi)
+    if not results.multi_face_landmarks:
+        return None
+    landmarks = results.multi_face_landmarks[0].landmark
+    return tuple(
+        (x0 + landmarks[i].x * (x1 - x0), y0 + landmarks[i].y * (y1 - y0))
+        for i in (LEFT_EYE, RIGHT_EYE)
     )
 
-    detector = vision.ObjectDetector.create_from_options(options)
-    detection_result = detector.detect(mp_image)
-
-    for detection in detection_result.detections:
-        category = detection.categories[0]
-        if category.category_name == "person":
-            bbox = detection.bounding_box
-            x, y, w, h = (
-                max(0, int(bbox.origin_x)), 
-                max(0, int(bbox.origin_y)), 
-                min(image.shape[1], int(bbox.width)), 
-                min(image.shape[0], int(bbox.height))
-            )
-
-            cropped_image = image[y:y+h, x:x+w]
-            if cropped_image.size > 0:
-                return save_image(cropped_image, "people", "person")
-            return None
+def chip_from_eyes(image: np.ndarray, box, eyes, size=FACE_CHIP_SIZE, margin: float = 0.2) -> np.ndarray:
+    """
+    Warps the face in box into a fixed-size chip in one cv2.warpAffine: rotated
+    about the eye midpoint so the eyes are level, scaled so the box plus margin
+    fills the chip, and centred on the box. Only the chip's pixels are sampled,
+    so the cost does not depend on the frame size.
+    """
+    x, y, w, h = box
+    (lx, ly), (rx, ry) = eyes
+    angle = np.degrees(np.arctan2(ry - ly, rx - lx))
+    scale = size[0] / (max(w, h) * (1 + 2 * margin))
+
+    rotation_matrix = cv2.getRotationMatrix2D(((lx + rx) / 2, (ly + ry) / 2), angle, scale)
+    cx, cy = rotation_matrix @ (x + w / 2, y + h / 2, 1.0)
+    rotation_matrix[0, 2] += size[0] / 2 - cx
+    rotation_matrix[1, 2] += size[1] / 2 - cy
+    return cv2.warpAffine(image, rotation_matrix, tuple(size), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+def align_face_chip(frame: FrameAnalysis, face, size=FACE_CHIP_SIZE, margin: float = 0.2,
+                    use_mesh: bool = True) -> np.ndarray:
+    """
+    Aligned, fixed-size chip for one detected face, with no second detection
+    pass. Eye positions come from FaceMesh run on the face region (use_mesh),
+    falling back to the face detector's own eye keypoints.
+
+    Returns:
+        np.ndarray: size[1] x size[0] BGR chip.
+    """
+    eyes = mesh_eye_centers(frame.rgb, face.box, margin) if use_mesh else None
+    if eyes is None and face.keypoints and len(face.keypoints) >= 2:
+        eyes = face.keypoints[:2]
+    if eyes is None:
+        x, y, w, h = face.box
+        eyes = ((x, y + h / 2), (x + w, y + h / 2))  # No eye positions: keep the box level
+    return chip_from_eyes(frame.image, face.box, eyes, size, margin)
+
+def align_faces(image, size=FACE_CHIP_SIZE, margin: float = 0.2):
+    """
+    Aligned, fixed-size chip (see align_face_chip) for every face in the frame,
+    best detection first. This is the one crop/alignment path used for both
+    gallery enrolment and live queries.
+    image may be a BGR ndarray or a FrameAnalysis whose detections are reused.
 
+    Returns:
+        list[np.ndarray]: size[1] x size[0] BGR chips, possibly empty.
+    """
+    frame = image if isinstance(image, FrameAnalysis) else FrameAnalysis(image)
+    return [align_face_chip(frame, face, size=size, margin=margin) for face in frame.faces]
+
+def detect_and_crop_person(image, max_results: int = 5, score_threshold: float = 0.25,
+                           save_dir: str = None) -> np.ndarray:
+    """
+    Detects a person using MediaPipe Object Detector and returns a cropped image.
+    image may be a BGR ndarray or a FrameAnalysis whose detections are reused.
+    The crop is a view into the frame, not a copy. If save_dir is given, the crop
+    is also written there as a side effect.
+    
+    Returns:
+        np.ndarray: Cropped person image, or None if no person is detected.
+    """
+    if not isinstance(image, FrameAnalysis):
+        image = FrameAnalysis(image, max_results=max_results, score_threshold=score_threshold)
+
+    if image.persons:
+        cropped_image = image.crop(image.persons[0])
+        if save_dir:
+            save_image(cropped_image, save_dir, "person")
+        return cropped_image
     return None
 
+def detect_and_crop_people(image, max_results: int = 5, score_threshold: float = 0.25,
+                           save_dir: str = None):
+    """
+    Like detect_and_crop_person, but returns a crop for every person detected,
+    highest-scoring first, ready for unknown_model.predict_people.
+    
+    Returns:
+        list[np.ndarray]: Cropped person images (views into the frame), possibly empty.
+    """
+    if not isinstance(image, FrameAnalysis):
+        image = FrameAnalysis(image, max_results=max_results, score_threshold=score_threshold)
+
+    crops = [image.crop(person) for person in image.persons]
+    if save_dir:
+        for crop in crops:
+            save_image(crop, save_dir, "person")
+    return crops
+
 # def main():
 #     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 #     parser.add_argument('--image', help='Path to an image file for detection.', type=str, default=None)
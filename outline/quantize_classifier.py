@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+quantize_classifier.py
+  Builds quantized variants of the occupation classifier and compares them
+  with the float32 model.
+
+  Conversion needs the trained Keras / SavedModel the float32 .tflite was
+  exported from (TFLite files cannot be re-quantized) and full TensorFlow:
+
+    python quantize_classifier.py --convert occupation_model.keras --calibration people
+
+  The comparison runs every variant over a directory of images with
+  unknown_model's own pre/post-processing and reports latency, agreement with
+  the float32 labels and, where the file name gives it away (police2.jpg,
+  delivery.jpg, ...), accuracy:
+
+    python quantize_classifier.py --compare --images test-images --threads 4
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+import unknown_model
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+# File name prefix -> expected label, for the images in test-images
+EXPECTED_LABELS = {
+    "construction": "construction_worker",
+    "delivery": "courier",
+    "courier": "courier",
+    "firefighter": "firefighter",
+    "police": "police_officer",
+}
+
+
+def list_images(directory) -> list:
+    return sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def expected_label(path: Path) -> "str | None":
+    name = path.stem.lower()
+    for prefix, label in EXPECTED_LABELS.items():
+        if name.startswith(prefix):
+            return label
+    return None
+
+
+# ---------- Conversion -----------------------------------------------------
+def convert(source_model: str, variant: str, calibration_dir: str = None, max_calibration: int = 200) -> str:
+    """
+    Writes unknown_model.MODEL_VARIANTS[variant] from source_model.
+
+    float16 stores weights as float16 and keeps float32 input/output. int8 is
+    full-integer quantization (int8 weights, activations, input and output),
+    calibrated on images from calibration_dir run through the same resize and
+    normalisation as inference.
+    """
+    import tensorflow as tf
+
+    if os.path.isdir(source_model):
+        converter = tf.lite.TFLiteConverter.from_saved_model(source_model)
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(source_model))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        images = list_images(calibration_dir) if calibration_dir else []
+        if not images:
+            raise SystemExit("int8 conversion needs calibration images (--calibration DIR)")
+        images = images[:max_calibration]
+
+        def representative_dataset():
+            for path in images:
+                yield [unknown_model._prepare_batch([path])]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    else:
+        raise ValueError(f"Unknown variant {variant!r}")
+
+    output = unknown_model.MODEL_VARIANTS[variant]
+    with open(output, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+    return output
+
+
+# ---------- Comparison -----------------------------------------------------
+def evaluate(variant: str, images, threads: int, delegate: str, repeat: int = 5) -> dict:
+    """Classifies every image with one variant; returns labels, confidences and latency."""
+    unknown_model.configure(variant=variant, num_threads=threads, delegate=delegate)
+    started = time.perf_counter()
+    unknown_model.load()
+    load_ms = (time.perf_counter() - started) * 1000.0
+
+    batches = [unknown_model._prepare_batch([path]) for path in images]
+    unknown_model._classify(batches[0])  # First invoke pays for kernel setup
+
+    latencies = []
+    predictions = []
+    for _ in range(repeat):
+        predictions = []
+        for batch in batches:
+            started = time.perf_counter()
+            predictions.append(unknown_model._classify(batch)[0])
+            latencies.append((time.perf_counter() - started) * 1000.0)
+
+    results = []
+    for probs in predictions:
+        best = int(np.argmax(probs))
+        confidence = float(probs[best])
+        label = unknown_model.LABELS[best] if confidence >= unknown_model.CONFIDENCE_THRESHOLD else unknown_model.UNKNOWN_LABEL
+        results.append((label, confidence, probs))
+
+    return {
+        "model": unknown_model.MODEL_PATH,
+        "size_mb": round(os.path.getsize(unknown_model.MODEL_PATH) / 1e6, 2),
+        "load_ms": round(load_ms, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "results": results,
+    }
+
+
+def compare(images_dir: str, variants, threads: int, delegate: str, repeat: int = 5) -> dict:
+    images = list_images(images_dir)
+    if not images:
+        raise SystemExit(f"No images found in {images_dir}")
+    expected = [expected_label(p) for p in images]
+
+    runs = {}
+    for variant in variants:
+        if not os.path.exists(unknown_model.MODEL_VARIANTS[variant]):
+            print(f"Skipping {variant}: {unknown_model.MODEL_VARIANTS[variant]} not found")
+            continue
+        runs[variant] = evaluate(variant, images, threads, delegate, repeat)
+    if not runs:
+        raise SystemExit("No classifier variants available")
+
+    reference = runs.get("float32")
+    report = {}
+    for variant, run in runs.items():
+        labels = [label for label, _, _ in run["results"]]
+        scored = [(label, want) for label, want in zip(labels, expected) if want]
+        row = {k: run[k] for k in ("model", "size_mb", "load_ms", "p50_ms", "p95_ms")}
+        row["accuracy"] = round(sum(l == w for l, w in scored) / len(scored), 3) if scored else None
+        if reference is not None:
+            ref_labels = [label for label, _, _ in reference["results"]]
+            ref_probs = np.stack([p for _, _, p in reference["results"]])
+            probs = np.stack([p for _, _, p in run["results"]])
+            row["agreement"] = round(sum(a == b for a, b in zip(labels, ref_labels)) / len(labels), 3)
+            row["max_prob_diff"] = round(float(np.abs(probs - ref_probs).max()), 4)
+            row["speedup"] = round(reference["p50_ms"] / run["p50_ms"], 2) if run["p50_ms"] else None
+            row["changed"] = [p.name for p, a, b in zip(images, labels, ref_labels) if a != b]
+        report[variant] = row
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize and compare occupation classifier variants")
+    parser.add_argument("--convert", metavar="MODEL", default=None,
+                        help="Trained .keras/.h5 file or SavedModel directory to quantize")
+    parser.add_argument("--calibration", default="people", help="Images for int8 calibration")
+    parser.add_argument("--compare", action="store_true", help="Compare variants on --images")
+    parser.add_argument("--images", default="test-images", help="Directory of images to classify")
+    parser.add_argument("--variants", nargs="+", default=list(unknown_model.MODEL_VARIANTS),
+                        choices=list(unknown_model.MODEL_VARIANTS), help="Variants to build/compare")
+    parser.add_argument("--threads", type=int, default=unknown_model.NUM_THREADS, help="Interpreter threads")
+    parser.add_argument("--delegate", default=unknown_model.DELEGATE,
+                        help='"xnnpack" (default CPU), "none" (reference kernels) or a delegate library path')
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the images")
+    parser.add_argument("--output", default=None, help="Write the comparison as JSON here")
+    args = parser.parse_args()
+
+    if args.convert:
+        for variant in args.variants:
+            if variant != "float32":
+                convert(args.convert, variant, args.calibration)
+
+    if args.compare or not args.convert:
+        report = compare(args.images, args.variants, args.threads, args.delegate, args.repeat)
+        print(f"{'variant':<10}{'size MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}{'agree':>8}{'acc':>7}")
+        for variant, row in report.items():
+            fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+            print(f"{variant:<10}{row['size_mb']:>9.2f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                  f"{fmt(row.get('speedup'), '.2f'):>9}{fmt(row.get('agreement'), '.0%'):>8}"
+                  f"{fmt(row['accuracy'], '.0%'):>7}")
+            if row.get("changed"):
+                print(f"  labels differ from float32 on: {', '.join(row['changed'])}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Saved comparison to {args.output}")
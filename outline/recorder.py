@@ -0,0 +1,213 @@
+"""
+recorder.py
+  Pre-event ring buffer and background event clip recording.
+
+  The capture loop hands every frame to EventRecorder.add(), which only
+  queues a reference. A buffer thread JPEG-compresses frames into a rolling
+  window of the last pre_seconds. trigger() on an alert snapshots that
+  window, keeps collecting frames for post_seconds, then passes the event to a
+  writer thread that saves an MJPG .avi clip plus a .jpg of the triggering
+  frame. Neither compression nor disk I/O ever runs on the capture loop.
+
+  Repeat triggers extend an open clip, but never past max_clip_seconds from
+  its first trigger; a visitor who stays in view produces a series of clips.
+  Memory is bounded by max_bytes across the rolling window and any events
+  still collecting post-event frames. Open events may use at most
+  1 - window_share of it, so the pre-event window of the next alert is never
+  starved; past that, the oldest event is cut short and written.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+RECORDER_BYTES = REGISTRY.gauge("ping_recorder_buffer_bytes", "Compressed frames held by the event recorder")
+RECORDER_DROPPED = REGISTRY.counter("ping_recorder_frames_dropped_total",
+                                    "Frames the event recorder could not keep up with")
+RECORDER_CLIPS = REGISTRY.counter("ping_recorder_clips_total", "Event clips written, by outcome")
+
+
+class _Event:
+    def __init__(self, label: str, timestamp: float, end: float, frames, keyframe):
+        self.label = label
+        self.timestamp = timestamp
+        self.end = end
+        self.frames = frames          # [(timestamp, jpeg bytes)], pre-event frames first
+        self.keyframe = keyframe      # BGR frame that raised the alert, or None
+        self.bytes = sum(len(data) for _, data in frames)
+
+
+class EventRecorder:
+    """
+    Args:
+        out_dir: Where clips (<source>_<time>_<label>.avi/.jpg) are written.
+        source: Camera name used in file names.
+        pre_seconds: Seconds of frames kept from before each alert.
+        post_seconds: Seconds of frames recorded after each alert.
+        max_bytes: Memory budget for compressed frames (window + open events).
+        max_clip_seconds: Longest a clip is extended by repeat triggers.
+        window_share: Part of max_bytes reserved for the pre-event window.
+        quality: JPEG quality of buffered frames.
+        max_pending: Frames allowed to wait for compression before new ones are dropped.
+    """
+
+    def __init__(self, out_dir: str, source: str = "camera", pre_seconds: float = 5.0,
+                 post_seconds: float = 5.0, max_bytes: int = 32 * 1024 * 1024,
+                 max_clip_seconds: float = 60.0, window_share: float = 0.25, quality: int = 80,
+                 max_pending: int = 8):
+        self.out_dir = out_dir
+        self.source = source
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.event_budget = int(max_bytes * (1.0 - window_share))
+        self.quality = quality
+
+        self._window = deque()        # (timestamp, jpeg bytes), oldest first
+        self._window_bytes = 0
+        self._events = []             # events still collecting post-event frames
+        self._lock = threading.Lock()
+        self._frames = queue.Queue(maxsize=max_pending)
+        self._finished = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._buffer_loop, name="recorder-buffer", daemon=True),
+            threading.Thread(target=self._write_loop, name="recorder-writer", daemon=True),
+        ]
+        self.frames_dropped = 0
+        self.clips_written = 0
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    # ---------- Capture-loop side: never blocks ---------------------------
+    def add(self, frame):
+        """Queues a capture.Frame for buffering; drops it if the buffer thread is behind."""
+        try:
+            self._frames.put_nowait((frame.timestamp, frame.image))
+        except queue.Full:
+            self.frames_dropped += 1
+            RECORDER_DROPPED.inc()
+
+    def trigger(self, label: str, image: np.ndarray = None):
+        """
+        Starts an event clip at the current time. Triggers while an event with
+        the same label is still recording extend it instead of starting another,
+        up to max_clip_seconds after its first trigger.
+        image (the frame that raised the alert) becomes the clip's keyframe.
+        """
+        now = time.time()
+        with self._lock:
+            for event in self._events:
+                if event.label == label and now < event.timestamp + self.max_clip_seconds:
+                    event.end = min(now + self.post_seconds, event.timestamp + self.max_clip_seconds)
+                    return
+            frames = [(t, data) for t, data in self._window if t >= now - self.pre_seconds]
+            self._events.append(_Event(label, now, now + self.post_seconds, frames, image))
+
+    # ---------- Buffer thread: compress, trim, collect post-event frames --
+    def _encode(self, image: np.ndarray) -> bytes:
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return data.tobytes() if ok else b""
+
+    def _buffer_loop(self):
+        while not self._stop.is_set():
+            try:
+                timestamp, image = self._frames.get(timeout=0.5)
+            except queue.Empty:
+                self._close_events(time.time())
+                continue
+            data = self._encode(image)
+            if not data:
+                continue
+
+            with self._lock:
+                self._window.append((timestamp, data))
+                self._window_bytes += len(data)
+                for event in self._events:
+                    if timestamp <= event.end:
+                        event.frames.append((timestamp, data))
+                        event.bytes += len(data)
+                self._trim(timestamp)
+            self._close_events(timestamp)
+
+    def _trim(self, now: float):
+        """Drops window frames older than pre_seconds or over the memory budget (lock held)."""
+        event_bytes = sum(event.bytes for event in self._events)
+        budget = self.max_bytes - min(event_bytes, self.event_budget)
+        while self._window and (self._window[0][0] < now - self.pre_seconds or self._window_bytes > budget):
+            _, data = self._window.popleft()
+            self._window_bytes -= len(data)
+        RECORDER_BYTES.set(self._window_bytes + event_bytes)
+
+    def _close_events(self, now: float):
+        """Finishes events past their end, then the oldest ones until the rest fit event_budget."""
+        with self._lock:
+            open_events, finished = [], []
+            held = 0
+            for event in reversed(self._events):      # newest first, so the oldest are cut
+                if now <= event.end and held + event.bytes <= self.event_budget:
+                    held += event.bytes
+                    open_events.append(event)
+                else:
+                    finished.append(event)
+            self._events = open_events[::-1]
+        for event in reversed(finished):
+            self._finished.put(event)
+
+    # ---------- Writer thread: decode + encode clip, disk I/O -------------
+    def _write_loop(self):
+        while True:
+            event = self._finished.get()
+            if event is None:
+                return
+            try:
+                self._write(event)
+                self.clips_written += 1
+                RECORDER_CLIPS.inc(result="ok")
+            except Exception as e:
+                print("Error writing event clip:", e)
+                RECORDER_CLIPS.inc(result="failed")
+
+    def _write(self, event: _Event):
+        stamp = datetime.fromtimestamp(event.timestamp).strftime("%Y%m%d-%H%M%S.%f")[:-3]
+        base = os.path.join(self.out_dir, f"{self.source}_{stamp}_{event.label}")
+        if event.keyframe is not None:
+            cv2.imwrite(base + ".jpg", event.keyframe)
+        if not event.frames:
+            return
+
+        duration = event.frames[-1][0] - event.frames[0][0]
+        fps = (len(event.frames) - 1) / duration if duration > 0 else 1.0
+        writer = None
+        try:
+            for _, data in event.frames:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if writer is None:
+                    h, w = image.shape[:2]
+                    writer = cv2.VideoWriter(base + ".avi", cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+                writer.write(image)
+        finally:
+            if writer is not None:
+                writer.release()
+        print(f"Saved event clip: {base}.avi ({len(event.frames)} frames, {duration:.1f}s)")
+
+    def stop(self):
+        """Writes any events still recording, then stops both threads."""
+        self._stop.set()
+        self._threads[0].join(timeout=2.0)
+        self._close_events(float("inf"))
+        self._finished.put(None)
+        self._threads[1].join(timeout=30.0)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+scheduler.py
+  Several cameras in one process, sharing one pool of model workers.
+
+  Each camera keeps its own StreamingCapture and MotionGate on a small feeder
+  thread. Frames that pass the gate wait in a one-frame slot per camera; a new
+  frame replaces one still waiting (the stale one is dropped), so memory and
+  latency stay bounded however far the workers fall behind.
+
+  A fixed pool of worker threads runs the recognition pipeline. Each worker
+  has its own MediaPipe detectors (see detectors.py); the gallery, Facenet and
+  the occupation classifier are loaded once and shared by every worker. When
+  several cameras have a frame waiting, workers pick by stride scheduling: a
+  camera with priority 3 gets three turns for every turn of a priority 1
+  camera, and a camera that was idle cannot bank turns to starve the others.
+  At most one frame per camera is in flight, so its alerts stay in order.
+  Every camera alerts over its own server connection, so each gets its own
+  share of the server's per-client rate limit.
+
+  Usage:
+    python scheduler.py --camera front_door=pi@3 \
+                        --camera back_door=video:back.mp4@2 \
+                        --camera garage=test:test-images --workers 2
+"""
+
+from startup import STARTUP  # first, so the start-up report covers every import
+
+import argparse
+import threading
+import time
+
+from socketio import Client
+
+from capture import StreamingCapture, DirectorySource, VideoFileSource, PiCameraSource
+import detectors
+from motion import MotionGate
+from metrics import REGISTRY, STAGE_SECONDS, FRAMES_PROCESSED, FRAMES_SKIPPED, FRAMES_DROPPED, ALERTS_SENT
+from detect import FrameAnalysis
+from preprocess import detect_and_crop_people
+from tracker import TrackedRecognizer
+import known_model
+from known_model import visitors_alert
+import unknown_model
+from unknown_model import occupation_alert
+
+STARTUP.mark("imports")
+
+METRICS_PUSH_SECONDS = 10.0
+
+
+def recognize(image, recognizer: TrackedRecognizer, crop_dir: str = None) -> "tuple[str, str]":
+    """
+    Runs the camera_with_processing.py pipeline on one frame, re-using the
+    camera's per-track results where they are still fresh.
+
+    Returns:
+        tuple: (alert type, message) for the alert this frame should raise.
+    """
+    analysis = FrameAnalysis(image)
+
+    with STAGE_SECONDS.time(stage="face_detect"):
+        faces = analysis.faces
+    if faces:
+        with STAGE_SECONDS.time(stage="face_recognize"):
+            msg = visitors_alert(recognizer.face_names(analysis))
+        if msg:
+            return "known_visitor", msg
+
+    with STAGE_SECONDS.time(stage="person_detect"):
+        people = detect_and_crop_people(analysis, save_dir=crop_dir)
+    if people:
+        with STAGE_SECONDS.time(stage="occupation_classify"):
+            msg = occupation_alert(recognizer.person_labels(analysis))
+        if msg:
+            return "occupation", msg
+
+    return "unknown_visitor", "Unknown visitor!"
+
+
+class Camera:
+    """
+    Args:
+        name: Source name attached to this camera's alerts.
+        source: FrameSource to stream from.
+        priority: Relative share of worker time when cameras compete.
+        fps: Maximum capture rate.
+        motion_threshold: See MotionGate.
+        track_ttl: See TrackedRecognizer.
+    """
+
+    def __init__(self, name: str, source, priority: float = 1.0, fps: float = 10.0,
+                 motion_threshold: float = 0.02, track_ttl: float = 30.0):
+        if priority <= 0:
+            raise ValueError(f"Camera {name}: priority must be positive")
+        self.name = name
+        self.priority = priority
+        self.capture = StreamingCapture(source, max_fps=fps)
+        self.gate = MotionGate(threshold=motion_threshold)
+        self.recognizer = TrackedRecognizer(ttl=track_ttl)  # Only touched by the worker holding busy
+
+        # Scheduler state, guarded by CameraScheduler._cond
+        self.pending = None     # Frame waiting for a worker
+        self.busy = False       # A worker is processing one of our frames
+        self.pass_value = 0.0   # Stride scheduling virtual time
+
+        self.frames_scheduled = 0
+        self.frames_dropped = 0
+
+    def stats(self) -> dict:
+        return {
+            "priority": self.priority,
+            "captured": self.capture.frames_captured,
+            "scheduled": self.frames_scheduled,
+            "dropped": self.frames_dropped,
+            **self.gate.stats(),
+        }
+
+
+class CameraScheduler:
+    """
+    Args:
+        cameras: Cameras to serve; names must be unique.
+        emit: Called as emit(camera_name, alert_type, message) from worker threads.
+        workers: Number of model worker threads shared by every camera.
+        max_frame_age: Seconds after capture beyond which a waiting frame is dropped.
+        crop_dir: Optionally save every person crop detected (see detect_and_crop_people).
+    """
+
+    def __init__(self, cameras, emit, workers: int = 2, max_frame_age: float = 2.0,
+                 crop_dir: str = None):
+        names = [camera.name for camera in cameras]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Camera names must be unique: {names}")
+        self.cameras = list(cameras)
+        self.emit = emit
+        self.max_frame_age = max_frame_age
+        self.crop_dir = crop_dir
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._global_pass = 0.0
+        self._threads = []
+        self._workers = workers
+
+    # ---------- Feeders: capture + motion gate, one thread per camera -----
+    def _feed(self, camera: Camera):
+        while not self._stop.is_set():
+            frame = camera.capture.read(timeout=0.5)
+            if frame is None:
+                if camera.capture.exhausted.is_set():
+                    print(f"[{camera.name}] source exhausted")
+                    return
+                continue
+
+            with STAGE_SECONDS.time(stage="motion_gate"):
+                moved = camera.gate.should_process(frame.image)
+            if not moved:
+                FRAMES_SKIPPED.inc(camera=camera.name)
+                continue
+
+            with self._cond:
+                if camera.pending is not None:
+                    self._drop(camera, "replaced")
+                elif not camera.busy:
+                    # Rejoining after being idle: no credit for the time away
+                    camera.pass_value = max(camera.pass_value, self._global_pass)
+                camera.pending = frame
+                self._cond.notify()
+
+    def _drop(self, camera: Camera, reason: str):
+        camera.frames_dropped += 1
+        FRAMES_DROPPED.inc(camera=camera.name, reason=reason)
+
+    # ---------- Workers: shared models, stride-scheduled across cameras ---
+    def _next(self):
+        """Blocks until some camera has a frame to process; returns (camera, frame)."""
+        with self._cond:
+            while not self._stop.is_set():
+                ready = [c for c in self.cameras if c.pending is not None and not c.busy]
+                if not ready:
+                    self._cond.wait(0.5)
+                    continue
+
+                camera = min(ready, key=lambda c: c.pass_value)
+                frame, camera.pending = camera.pending, None
+                if time.time() - frame.timestamp > self.max_frame_age:
+                    self._drop(camera, "stale")
+                    continue
+
+                camera.busy = True
+                camera.frames_scheduled += 1
+                self._global_pass = camera.pass_value
+                camera.pass_value += 1.0 / camera.priority
+                return camera, frame
+        return None, None
+
+    def _done(self, camera: Camera):
+        with self._cond:
+            camera.busy = False
+            self._cond.notify()
+
+    def _work(self):
+        detectors.warm_up()
+        while True:
+            camera, frame = self._next()
+            if camera is None:
+                return
+            try:
+                FRAMES_PROCESSED.inc(camera=camera.name)
+                alert_type, msg = recognize(frame.image, camera.recognizer, crop_dir=self.crop_dir)
+                self.emit(camera.name, alert_type, msg)
+                ALERTS_SENT.inc(type=alert_type, camera=camera.name)
+                STARTUP.mark("first_alert")
+            except Exception as e:
+                print(f"[{camera.name}] Error processing frame:", e)
+            finally:
+                self._done(camera)
+
+    # ---------- Lifecycle -------------------------------------------------
+    def start(self):
+        for camera in self.cameras:
+            camera.capture.start()
+        STARTUP.mark("capture_started")
+
+        for i in range(self._workers):
+            self._threads.append(threading.Thread(target=self._work, name=f"model-worker-{i}", daemon=True))
+        for camera in self.cameras:
+            self._threads.append(threading.Thread(target=self._feed, args=(camera,),
+                                                  name=f"feed-{camera.name}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def running(self) -> bool:
+        """True while any camera is still streaming."""
+        return not self._stop.is_set() and any(not c.capture.exhausted.is_set() for c in self.cameras)
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+        for camera in self.cameras:
+            camera.capture.stop()
+        detectors.shutdown()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {camera.name: camera.stats() for camera in self.cameras}
+
+
+def parse_camera(spec: str, test_dir: str = "test-images") -> "tuple[str, object, float]":
+    """
+    Parses NAME=KIND[:ARG][@PRIORITY], where KIND is pi (ARG: camera number,
+    default 0), test (ARG: image directory) or video (ARG: file), e.g.
+    "garage=video:garage.mp4@2" or "porch=pi:1".
+
+    Returns:
+        tuple: (name, FrameSource, priority)
+    """
+    name, sep, rest = spec.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"Expected NAME=KIND[:ARG][@PRIORITY], got {spec!r}")
+    rest, _, priority = rest.partition("@")
+    kind, _, arg = rest.partition(":")
+
+    if kind == "pi":
+        if arg and not arg.isdigit():
+            raise argparse.ArgumentTypeError(f"Pi camera number must be an integer in {spec!r}")
+        source = PiCameraSource(camera=int(arg or 0))
+    elif kind == "test":
+        source = DirectorySource(arg or test_dir, shuffle=True)
+    elif kind == "video" and arg:
+        source = VideoFileSource(arg)
+    else:
+        raise argparse.ArgumentTypeError(f"Unknown camera source {rest!r} in {spec!r}")
+
+    try:
+        return name, source, float(priority) if priority else 1.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Priority must be a number in {spec!r}")
+
+
+def main(cameras, workers: int = 2, max_frame_age: float = 2.0, crop_dir: str = None,
+         server: str = "http://localhost:8080", metrics_source: str = "cameras"):
+    socket = Client()
+    socket.connect(server)
+    # One connection per camera: the server rate-limits alerts per connection,
+    # so a busy camera cannot use up the others' budget. A camera has at most
+    # one frame in flight, so its connection is only used by one worker at a time.
+    camera_sockets = {}
+    for camera in cameras:
+        camera_sockets[camera.name] = Client()
+        camera_sockets[camera.name].connect(server)
+
+    def emit(camera_name, alert_type, msg):
+        camera_sockets[camera_name].emit("alert", {"message": msg, "source": camera_name, "type": alert_type})
+        print(f"[{camera_name}] Alert sent:", msg)
+
+    # Shared by every worker, so load them once here rather than racing on first use
+    known_model.load()
+    unknown_model.load()
+    STARTUP.mark("models_ready")
+
+    scheduler = CameraScheduler(cameras, emit, workers=workers,
+                                max_frame_age=max_frame_age, crop_dir=crop_dir)
+    scheduler.start()
+    last_push = time.monotonic()
+    try:
+        while scheduler.running():
+            time.sleep(0.5)
+            if time.monotonic() - last_push >= METRICS_PUSH_SECONDS:
+                socket.emit("metrics", {"source": metrics_source, "metrics": REGISTRY.snapshot()})
+                last_push = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+        for name, stats in scheduler.stats().items():
+            print(f"{name}: {stats}")
+        for camera_socket in camera_sockets.values():
+            camera_socket.disconnect()
+        socket.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ping multi-camera capture & alert loop")
+    parser.add_argument(
+        "--camera",
+        action="append",
+        required=True,
+        help="NAME=KIND[:ARG][@PRIORITY] with KIND pi[:N], test or video; repeat per camera",
+    )
+    parser.add_argument("--workers", type=int, default=2, help="Model worker threads shared by all cameras")
+    parser.add_argument("--fps", type=float, default=10.0, help="Maximum capture rate per camera")
+    parser.add_argument(
+        "--motion-threshold",
+        type=float,
+        default=0.02,
+        help="Fraction of the frame that must change before recognition runs",
+    )
+    parser.add_argument(
+        "--max-frame-age",
+        type=float,
+        default=2.0,
+        help="Drop frames that waited longer than this many seconds for a worker",
+    )
+    parser.add_argument(
+        "--track-ttl",
+        type=float,
+        default=30.0,
+        help="Seconds a tracked visitor's identity/occupation is reused before re-running the models",
+    )
+    parser.add_argument("--test-dir", default="test-images", help="Default directory for test cameras")
+    parser.add_argument("--server", default="http://localhost:8080", help="Socket.IO server to alert")
+    parser.add_argument(
+        "--crop-dir",
+        default=None,
+        help="Save every person crop detected on a processed frame here, whether or not it alerts",
+    )
+    args = parser.parse_args()
+
+    cameras = []
+    for spec in args.camera:
+        try:
+            name, source, priority = parse_camera(spec, args.test_dir)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+        cameras.append(Camera(name, source, priority=priority, fps=args.fps,
+                              motion_threshold=args.motion_threshold, track_ttl=args.track_ttl))
+
+    main(cameras, workers=args.workers, max_frame_age=args.max_frame_age,
+         crop_dir=args.crop_dir, server=args.server)
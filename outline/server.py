@@ -1,54 +1,257 @@
 import base64
-from io import BytesIO
-from PIL import Image
-from flask import Flask
+import binascii
+from flask import Flask, Response, request
 from flask_socketio import SocketIO, emit
 import os
-from datetime import datetime
+import threading
+import uuid
+
+from alerts import AlertCoalescer
+from enrollment import EnrollmentJob, EnrollmentQueue, PersonUpdateJob
+from gallery import identity_dir
+from known_model import get_gallery
+from metrics import REGISTRY, render, with_labels
+
+DATA_DIR = "known_people_dataset"
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024   # Largest photo accepted for enrollment
+MAX_CHUNK_BYTES = 512 * 1024
+MAX_UPLOADS_PER_CLIENT = 2            # In-flight chunked uploads per connection
+MAX_UPLOADS = 16                      # ... and across all connections
+MAX_METRIC_PUSHERS = 32               # Capture processes whose pushed metrics are kept
+ALERT_WINDOW_SECONDS = float(os.environ.get("ALERT_WINDOW_SECONDS", 30))
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", max_http_buffer_size=2 * MAX_CHUNK_BYTES)
+
+
+def notify_registration(sid, payload):
+    """Reports enrollment progress to the uploader; finished enrolments go to everyone."""
+    if payload.get('status') == 'done' or sid is None:
+        socketio.emit('image_registration_result', payload)
+    else:
+        socketio.emit('image_registration_result', payload, to=sid)
+
+
+def notify_person_update(sid, payload):
+    """Finished deletions and renames go to everyone, failures only to the requester."""
+    if payload.get('status') == 'done' or sid is None:
+        socketio.emit('person_update_result', payload)
+    else:
+        socketio.emit('person_update_result', payload, to=sid)
+
+
+enrollment_queue = EnrollmentQueue(get_gallery, notify_registration, data_dir=DATA_DIR,
+                                   notify_update=notify_person_update)
+
+# In-flight chunked uploads: (sid, upload_id) -> {"name", "size", "data"}
+_uploads = {}
+_uploads_lock = threading.Lock()
+
+
+def _enqueue(upload_id, name, data):
+    """Hands a complete upload to the background enrollment workers."""
+    if enrollment_queue.submit(EnrollmentJob(upload_id, name, bytes(data), request.sid)):
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'queued',
+                                           'message': f"Processing image for {name}..."})
+    else:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Server busy, please retry.'})
+
+SOCKET_CLIENTS = REGISTRY.gauge("ping_socketio_clients", "Connected Socket.IO clients")
+UPLOAD_QUEUE_DEPTH = REGISTRY.gauge("ping_upload_queue_depth", "Uploads waiting for background enrollment")
+UPLOADS_IN_FLIGHT = REGISTRY.gauge("ping_uploads_in_flight", "Chunked uploads still receiving data")
+
+# Latest snapshot pushed by each capture process: sid -> (source, Registry.snapshot())
+_pushed_metrics = {}
+
 
 @app.route("/")
 def index():
     return {"status": "Server is running"}
 
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of server metrics plus every capture process's pushed stats."""
+    UPLOAD_QUEUE_DEPTH.set(enrollment_queue.depth())
+    UPLOADS_IN_FLIGHT.set(len(_uploads))
+
+    snapshot = REGISTRY.snapshot()
+    sources = set()
+    for source, pushed in list(_pushed_metrics.values()):
+        if source not in sources:     # Two connections claiming one source would clash
+            sources.add(source)
+            snapshot += with_labels(pushed, {"source": source})
+    return Response(render(snapshot), mimetype="text/plain; version=0.0.4")
+
+@socketio.on('metrics')
+def handle_metrics_push(data):
+    """Capture processes push their Registry.snapshot() here periodically, one entry per connection."""
+    if request.sid not in _pushed_metrics and len(_pushed_metrics) >= MAX_METRIC_PUSHERS:
+        return
+    _pushed_metrics[request.sid] = (str(data.get('source') or request.sid), data.get('metrics') or [])
+
+@socketio.on('connect')
+def handle_connect(*args):
+    SOCKET_CLIENTS.inc()
+
+alert_coalescer = AlertCoalescer(window=ALERT_WINDOW_SECONDS)
+
+
+def flush_alerts():
+    """Broadcasts "(xN)" summaries for alert windows that folded in repeats."""
+    while True:
+        socketio.sleep(1)
+        for source, alert_type, message in alert_coalescer.flush():
+            print(f"Alert summary: {message}")
+            socketio.emit("alert", {"message": message, "source": source, "type": alert_type})
+
+
 # SocketIO event handler for alert (visitor alerts)
 @socketio.on('alert')
 def handle_alert(data):
-    print(f"Alert received: {data['message']}")
-    # You can send the alert back to the frontend if needed
-    emit("alert", {"message": data["message"]}, broadcast=True)
+    message = data['message']
+    source = data.get('source', request.sid)
+    alert_type = data.get('type', 'alert')
+    print(f"Alert received from {source}: {message}")
+
+    # Duplicates within the window are folded into a later summary
+    outgoing = alert_coalescer.submit(request.sid, source, alert_type, message)
+    if outgoing:
+        emit("alert", {"message": outgoing, "source": source, "type": alert_type}, broadcast=True)
 
 @socketio.on('upload_image_bytes')
 def handle_image_bytes_upload(data):
+    """Legacy single-message upload with the image as a base64 string."""
     name = data.get('name')
     image_data = data.get('imageData')
 
     if not name or not image_data:
         emit('image_registration_result', {'message': 'Missing name or image data'})
         return
+    if identity_dir(name, DATA_DIR) is None:
+        emit('image_registration_result', {'message': 'Invalid name.'})
+        return
+    if len(image_data) > (MAX_UPLOAD_BYTES + 2) // 3 * 4:
+        emit('image_registration_result', {'message': 'Image too large.'})
+        return
 
     try:
-        # Decode base64 to bytes
         image_bytes = base64.b64decode(image_data)
+    except (binascii.Error, ValueError):
+        emit('image_registration_result', {'message': 'Failed to process image.'})
+        return
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        emit('image_registration_result', {'message': 'Image too large.'})
+        return
+    _enqueue(str(uuid.uuid4()), name, image_bytes)
 
-        # Convert bytes to an image file using PIL
-        image = Image.open(BytesIO(image_bytes))
+@socketio.on('upload_image_start')
+def handle_upload_start(data):
+    """Begins a binary upload: {uploadId, name, size}. Chunks follow in order."""
+    upload_id = data.get('uploadId') or str(uuid.uuid4())
+    name = data.get('name')
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Invalid upload size.'})
+        return
 
-        # Save the image to disk (optional)
-        save_path = os.path.join("known_people_dataset", f"{name}", f"{datetime.now().timestamp()}.jpg")
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        image.save(save_path)
+    if not name or size <= 0:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Missing name or image data'})
+        return
+    if identity_dir(name, DATA_DIR) is None:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Invalid name.'})
+        return
+    if size > MAX_UPLOAD_BYTES:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Image too large.'})
+        return
 
-        # Emit result
-        emit('image_registration_result', {'message': f"{save_path}"}, broadcast=True)
+    with _uploads_lock:
+        mine = sum(1 for sid, _ in _uploads if sid == request.sid)
+        busy = mine >= MAX_UPLOADS_PER_CLIENT or len(_uploads) >= MAX_UPLOADS
+        if not busy:
+            _uploads[(request.sid, upload_id)] = {'name': name, 'size': size, 'data': bytearray()}
+    if busy:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Too many uploads in progress, please retry.'})
+        return
+    return {'uploadId': upload_id, 'maxChunk': MAX_CHUNK_BYTES}
+
+@socketio.on('upload_image_chunk')
+def handle_upload_chunk(data):
+    """Appends one binary chunk: {uploadId, offset, data: bytes}."""
+    upload_id = data.get('uploadId')
+    chunk = data.get('data') or b''
+    with _uploads_lock:
+        upload = _uploads.get((request.sid, upload_id))
+        if upload is None:
+            emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                               'message': 'Unknown upload.'})
+            return
+        if data.get('offset', len(upload['data'])) != len(upload['data']) \
+                or len(upload['data']) + len(chunk) > upload['size']:
+            del _uploads[(request.sid, upload_id)]
+            emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                               'message': 'Upload corrupted, please retry.'})
+            return
+        upload['data'] += chunk
+        received, size = len(upload['data']), upload['size']
+
+    emit('image_registration_result', {'uploadId': upload_id, 'status': 'progress',
+                                       'received': received, 'size': size,
+                                       'message': f"Uploading... {100 * received // size}%"})
+
+@socketio.on('upload_image_end')
+def handle_upload_end(data):
+    """Finishes a binary upload and queues it for enrollment."""
+    upload_id = data.get('uploadId')
+    with _uploads_lock:
+        upload = _uploads.pop((request.sid, upload_id), None)
+    if upload is None or len(upload['data']) != upload['size']:
+        emit('image_registration_result', {'uploadId': upload_id, 'status': 'failed',
+                                           'message': 'Upload incomplete, please retry.'})
+        return
+    _enqueue(upload_id, upload['name'], upload['data'])
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    SOCKET_CLIENTS.dec()
+    alert_coalescer.forget_client(request.sid)
+    _pushed_metrics.pop(request.sid, None)
+    with _uploads_lock:
+        for key in [k for k in _uploads if k[0] == request.sid]:
+            del _uploads[key]
+
+
+@socketio.on('delete_person')
+def handle_delete_person(data):
+    """Queues a deletion; the gallery may need building, which must not block the server."""
+    name = data.get('name')
+    if identity_dir(name, DATA_DIR) is None:
+        emit('person_update_result', {'status': 'failed', 'message': f"Unknown person: {name}"})
+        return
+    _submit_update(PersonUpdateJob(name, sid=request.sid))
+
+@socketio.on('rename_person')
+def handle_rename_person(data):
+    """Queues a rename, handled by the enrollment worker like handle_delete_person."""
+    name = data.get('name')
+    new_name = data.get('newName')
+    if identity_dir(name, DATA_DIR) is None or identity_dir(new_name, DATA_DIR) is None:
+        emit('person_update_result', {'status': 'failed', 'message': 'Missing or unknown name'})
+        return
+    _submit_update(PersonUpdateJob(name, new_name, sid=request.sid))
 
-    except Exception as e:
-        print("Error processing image upload:", e)
-        emit('image_registration_result', {'message': 'Failed to process image.'})
 
+def _submit_update(job):
+    if not enrollment_queue.submit(job):
+        emit('person_update_result', {'status': 'failed', 'message': 'Server busy, please retry.'})
 
 if __name__ == "__main__":
     print("Starting WebSocket server...")
+    socketio.start_background_task(flush_alerts)
     socketio.run(app, host="0.0.0.0", port=8080)
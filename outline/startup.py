@@ -0,0 +1,68 @@
+"""
+startup.py
+  Time-to-first-alert report for the capture processes.
+
+  Import this module first in an entry script, then call STARTUP.mark(phase)
+  as start-up progresses. Times are measured from process start (read from
+  /proc on Linux, so interpreter and import time are included). When the
+  "first_alert" phase is marked, the report is printed and checked against
+  the budget given by --startup-budget / PING_STARTUP_BUDGET.
+"""
+
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+STARTUP_SECONDS = REGISTRY.gauge("ping_startup_seconds", "Seconds from process start to each start-up phase")
+
+
+def _process_age() -> float:
+    """Seconds since this process started, or 0.0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime) is in clock ticks since boot; the name in
+            # field 2 may contain spaces, so split after its closing paren.
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupReport:
+    def __init__(self, budget: float = None):
+        self.budget = budget
+        self._origin = time.monotonic() - _process_age()
+        self.phases = []
+        self._lock = threading.Lock()   # Scheduler workers mark phases concurrently
+
+    def mark(self, phase: str) -> float:
+        """Records phase as reached now; returns seconds since process start."""
+        elapsed = time.monotonic() - self._origin
+        with self._lock:
+            if any(name == phase for name, _ in self.phases):
+                return elapsed
+            self.phases.append((phase, elapsed))
+            STARTUP_SECONDS.set(round(elapsed, 3), phase=phase)
+            if phase == "first_alert":
+                self.report()
+        return elapsed
+
+    def report(self):
+        print("Startup timeline (seconds since process start):")
+        previous = 0.0
+        for phase, elapsed in self.phases:
+            print(f"  {phase:<24}{elapsed:8.2f}  (+{elapsed - previous:.2f})")
+            previous = elapsed
+        if self.budget is not None and self.phases:
+            total = self.phases[-1][1]
+            status = "within" if total <= self.budget else "OVER"
+            print(f"  {status} budget of {self.budget:.1f}s ({total:.2f}s)")
+
+
+STARTUP = StartupReport(
+    budget=float(os.environ["PING_STARTUP_BUDGET"]) if os.environ.get("PING_STARTUP_BUDGET") else None
+)
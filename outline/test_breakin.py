@@ -0,0 +1,61 @@
+"""
+test_breakin.py
+  Checks that EwmaDetector alerts on the simulator's bursts and stays quiet
+  on plain noise. Run from outline/: python -m pytest -q test_breakin.py
+"""
+
+import numpy as np
+import pytest
+
+from breakin import EwmaDetector, SimulatedSensor
+
+
+def _run(detector, readings, batch=50):
+    alerts = []
+    for lo in range(0, len(readings), batch):
+        alerts += [lo + i for i, _ in detector.update(readings[lo:lo + batch])]
+    return alerts
+
+
+@pytest.mark.parametrize("offset", [-100.0, -150.0, -300.0])
+def test_burst_raises_alert(offset):
+    rng = np.random.default_rng(0)
+    readings = 500.0 + rng.normal(0.0, 10.0, 2000)
+    readings[1000:1040] += offset
+
+    alerts = _run(EwmaDetector(), readings)
+    assert len(alerts) == 1
+    assert 1000 <= alerts[0] < 1040
+
+
+def test_noise_does_not_alert():
+    readings = 500.0 + np.random.default_rng(1).normal(0.0, 10.0, 20000)
+    assert _run(EwmaDetector(), readings) == []
+
+
+def test_simulated_sensor_bursts_alert():
+    sensor = SimulatedSensor(rate_hz=1e9, burst_probability=0.002, seed=3)
+    sensor.open()
+    readings = np.concatenate([sensor.read_batch(50) for _ in range(200)])
+    assert _run(EwmaDetector(), readings)
+
+
+def test_lasting_level_change_becomes_baseline():
+    readings = 500.0 + np.random.default_rng(2).normal(0.0, 10.0, 6000)
+    readings[1000:] -= 150.0
+
+    detector = EwmaDetector()
+    alerts = _run(detector, readings)
+    assert len(alerts) == 1
+    assert abs(detector.mean - 350.0) < 10.0
+
+
+def test_batch_size_does_not_change_result():
+    rng = np.random.default_rng(4)
+    readings = 500.0 + rng.normal(0.0, 10.0, 3000)
+    readings[1500:1540] -= 120.0
+
+    a, b = EwmaDetector(), EwmaDetector()
+    assert _run(a, readings, batch=7) == _run(b, readings, batch=500)
+    assert a.mean == pytest.approx(b.mean)
+    assert a.var == pytest.approx(b.var)
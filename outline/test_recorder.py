@@ -0,0 +1,45 @@
+"""
+test_recorder.py
+  Checks that EventRecorder cuts the oldest open events first when they
+  outgrow the memory budget. Run from outline/: python -m pytest -q test_recorder.py
+"""
+
+from recorder import EventRecorder, _Event
+
+
+def _event(label, timestamp, size):
+    return _Event(label, timestamp, timestamp + 5.0, [(timestamp, b"x" * size)], None)
+
+
+def _finished(recorder):
+    labels = []
+    while not recorder._finished.empty():
+        labels.append(recorder._finished.get().label)
+    return labels
+
+
+def test_oldest_event_is_cut_when_over_budget():
+    recorder = EventRecorder("unused", max_bytes=1000, window_share=0.25)
+    recorder._events = [_event("old", 0.0, 600), _event("new", 1.0, 200)]   # 800 > 750 for events
+
+    recorder._close_events(2.0)
+    assert [event.label for event in recorder._events] == ["new"]
+    assert _finished(recorder) == ["old"]
+
+
+def test_events_within_budget_stay_open():
+    recorder = EventRecorder("unused", max_bytes=1000, window_share=0.25)
+    recorder._events = [_event("old", 0.0, 400), _event("new", 1.0, 300)]
+
+    recorder._close_events(2.0)
+    assert [event.label for event in recorder._events] == ["old", "new"]
+    assert _finished(recorder) == []
+
+
+def test_expired_event_does_not_count_against_budget():
+    recorder = EventRecorder("unused", max_bytes=1000, window_share=0.25)
+    recorder._events = [_event("old", 0.0, 600), _event("mid", 4.0, 100), _event("new", 5.0, 600)]
+
+    recorder._close_events(6.0)                # "old" ended at 5.0
+    assert [event.label for event in recorder._events] == ["mid", "new"]
+    assert _finished(recorder) == ["old"]
@@ -0,0 +1,216 @@
+"""
+tracker.py
+  Lightweight multi-object tracking with a per-track result cache.
+
+  Face and person boxes are associated across frames by IoU, falling back to
+  centroid distance for small or fast-moving boxes. Each track remembers the
+  last identity (or occupation) the models gave it and for how long that
+  result may be reused, so a visitor standing at the door for 30 seconds is
+  recognized once rather than on every frame. The models run again only for
+  new tracks or when the cached result expires. Misses and low-confidence
+  results (e.g. a visitor who is not enrolled) are cached too and retried on
+  an exponential backoff from retry_interval up to ttl, or sooner once the
+  box has moved enough that the models would see a different view.
+"""
+
+import itertools
+import time
+
+import known_model
+import unknown_model
+from metrics import REGISTRY
+from preprocess import align_face_chip
+
+TRACK_LOOKUPS = REGISTRY.counter("ping_track_lookups_total",
+                                 "Per-track results served from the track cache (cached) or the models (recognized)")
+
+FACE_MIN_CONFIDENCE = 1.0 - known_model.MATCH_THRESHOLD   # 1 - cosine distance: any accepted match
+
+
+def iou(a, b) -> float:
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def center_distance(a, b) -> float:
+    """Distance between box centres, relative to the mean size of the two boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    dx = (ax + aw / 2) - (bx + bw / 2)
+    dy = (ay + ah / 2) - (by + bh / 2)
+    scale = ((aw * ah) ** 0.5 + (bw * bh) ** 0.5) / 2 or 1.0
+    return (dx * dx + dy * dy) ** 0.5 / scale
+
+
+class Track:
+    def __init__(self, track_id: int, detection, now: float):
+        self.id = track_id
+        self.detection = detection
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+
+        self.result = None          # Cached name / occupation label
+        self.confidence = 0.0
+        self.recognized_at = None   # When the models last ran for this track
+        self.recognized_box = None  # Box the models last saw
+        self.retries = 0            # Low-confidence results in a row
+
+    @property
+    def box(self):
+        return self.detection.box
+
+
+class Tracker:
+    """
+    Args:
+        iou_threshold: Minimum IoU to continue a track.
+        max_center_distance: Fallback match when IoU fails: centre distance in
+            units of box size.
+        max_age: Seconds a track survives without a matching detection.
+        ttl: Seconds a confident cached result is reused.
+        min_confidence: Results below this are retried.
+        retry_interval: Seconds before the first retry of a low-confidence
+            result; doubles with every further one, up to ttl.
+        retry_iou: A low-confidence track is retried early (but not before
+            retry_interval) once its box overlaps the box last recognized by
+            less than this.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_center_distance: float = 0.5,
+                 max_age: float = 3.0, ttl: float = 30.0, min_confidence: float = 0.7,
+                 retry_interval: float = 1.0, retry_iou: float = 0.5, clock=time.monotonic):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_age = max_age
+        self.ttl = ttl
+        self.min_confidence = min_confidence
+        self.retry_interval = retry_interval
+        self.retry_iou = retry_iou
+        self.clock = clock
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, detections):
+        """
+        Associates this frame's detections with existing tracks, starting new
+        tracks for the rest and dropping tracks not seen for max_age.
+
+        Returns:
+            list[Track]: The track for each detection, in the same order.
+        """
+        now = self.clock()
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+        assigned = [None] * len(detections)
+        free = set(range(len(self.tracks)))
+
+        # Greedy association: best IoU pairs first, then nearest centres
+        pairs = sorted(
+            ((iou(t.box, d.box), ti, di) for ti, t in enumerate(self.tracks) for di, d in enumerate(detections)),
+            reverse=True,
+        )
+        for score, ti, di in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in free and assigned[di] is None:
+                free.discard(ti)
+                assigned[di] = self.tracks[ti]
+
+        pairs = sorted(
+            (center_distance(self.tracks[ti].box, d.box), ti, di)
+            for ti in free for di, d in enumerate(detections) if assigned[di] is None
+        )
+        for distance, ti, di in pairs:
+            if distance > self.max_center_distance:
+                break
+            if ti in free and assigned[di] is None:
+                free.discard(ti)
+                assigned[di] = self.tracks[ti]
+
+        for di, detection in enumerate(detections):
+            track = assigned[di]
+            if track is None:
+                track = assigned[di] = Track(next(self._ids), detection, now)
+                self.tracks.append(track)
+            else:
+                track.detection = detection
+                track.last_seen = now
+                track.hits += 1
+        return assigned
+
+    def needs_recognition(self, track: Track) -> bool:
+        """True if the models should run for track on this frame."""
+        if track.recognized_at is None:
+            return True
+        age = self.clock() - track.recognized_at
+        if track.confidence >= self.min_confidence:
+            return age >= self.ttl
+        if age < self.retry_interval:
+            return False
+        backoff = min(self.ttl, self.retry_interval * 2 ** (track.retries - 1))
+        return age >= backoff or iou(track.recognized_box, track.box) < self.retry_iou
+
+    def remember(self, track: Track, result, confidence: float):
+        track.result = result
+        track.confidence = confidence
+        track.recognized_at = self.clock()
+        track.recognized_box = track.box
+        track.retries = track.retries + 1 if confidence < self.min_confidence else 0
+
+
+class TrackedRecognizer:
+    """
+    Face and occupation recognition for one camera, re-using per-track results.
+
+    Usage:
+        recognizer = TrackedRecognizer()
+        names = recognizer.face_names(analysis)       # like predict_faces
+        labels = recognizer.person_labels(analysis)   # like predict_people labels
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.faces = Tracker(ttl=ttl, min_confidence=FACE_MIN_CONFIDENCE)
+        self.persons = Tracker(ttl=ttl, min_confidence=unknown_model.CONFIDENCE_THRESHOLD)
+
+    def _refresh(self, tracker: Tracker, tracks, kind: str, run):
+        stale = [t for t in tracks if tracker.needs_recognition(t)]
+        if stale:
+            for track, (result, confidence) in zip(stale, run(stale)):
+                tracker.remember(track, result, confidence)
+            TRACK_LOOKUPS.inc(len(stale), kind=kind, source="recognized")
+        if len(tracks) > len(stale):
+            TRACK_LOOKUPS.inc(len(tracks) - len(stale), kind=kind, source="cached")
+        return [t.result for t in tracks]
+
+    def face_names(self, analysis):
+        """
+        Returns:
+            list: The matched name for each face in analysis, or None where nobody matched.
+        """
+        tracks = self.faces.update(analysis.faces)
+
+        def run(stale):
+            matches = known_model.match_faces([align_face_chip(analysis, t.detection) for t in stale])
+            return [(name, 1.0 - distance) for name, distance in matches]
+
+        return self._refresh(self.faces, tracks, "face", run)
+
+    def person_labels(self, analysis):
+        """
+        Returns:
+            list[str]: The occupation label for each person in analysis.
+        """
+        tracks = self.persons.update(analysis.persons)
+
+        def run(stale):
+            return unknown_model.predict_people([analysis.crop(t.detection) for t in stale])
+
+        return self._refresh(self.persons, tracks, "person", run)
@@ -1,35 +1,242 @@
 import time
 import os
-import tensorflow as tf
+import threading
+import cv2
 import numpy as np
-from PIL import Image
 
 
-MODEL_PATH = "occupation_classifier.tflite"
+# Same classifier at different precisions; the quantized files are produced by
+# quantize_classifier.py from the trained model
+MODEL_VARIANTS = {
+    "float32": "occupation_classifier.tflite",
+    "float16": "occupation_classifier_float16.tflite",
+    "int8": "occupation_classifier_int8.tflite",
+}
+MODEL_PATH = os.environ.get("PING_OCCUPATION_MODEL") or MODEL_VARIANTS[os.environ.get("PING_OCCUPATION_VARIANT", "float32")]
+NUM_THREADS = int(os.environ.get("PING_TFLITE_THREADS") or os.cpu_count() or 1)
+DELEGATE = os.environ.get("PING_TFLITE_DELEGATE", "xnnpack")  # "xnnpack", "none" or a delegate .so path
+
 LABELS = ["courier", "construction_worker", "police_officer", "firefighter"]
 IMG_SIZE = (180, 180)
+# Bump when _load/_resize/_prepare_batch change, so cached probabilities are not reused
+PREPROCESS_VERSION = 2
 CONFIDENCE_THRESHOLD = 0.7
 
-interpreter = tf.lite.Interpreter(model_path=MODEL_PATH)
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
+UNKNOWN_LABEL = "Unknown"
+
+# Built on first use by _get_interpreter(); importing this module loads nothing
+interpreter = None
+input_details = None
+output_details = None
+runtime = None          # "tflite_runtime" or "tensorflow", once loaded
+
+_batch_size = 1
+_lock = threading.Lock()
+
+
+def _tflite():
+    """
+    Prefers the standalone tflite_runtime package, which loads in a fraction of
+    the time and memory of full TensorFlow, and falls back to tf.lite.
+
+    Returns:
+        tuple: (Interpreter, load_delegate, OpResolverType) from whichever is installed.
+    """
+    global runtime
+    try:
+        from tflite_runtime.interpreter import Interpreter, load_delegate, OpResolverType
+        runtime = "tflite_runtime"
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+        load_delegate = tf.lite.experimental.load_delegate
+        OpResolverType = tf.lite.experimental.OpResolverType
+        runtime = "tensorflow"
+    return Interpreter, load_delegate, OpResolverType
+
+
+def _build_interpreter(model_path: str, num_threads: int, delegate: str):
+    """
+    XNNPACK is TFLite's default CPU delegate and uses num_threads; "none" runs
+    the reference kernels instead, and anything else is loaded as an external
+    delegate library (e.g. libedgetpu.so.1).
+    """
+    Interpreter, load_delegate, OpResolverType = _tflite()
+    kwargs = {"model_path": model_path, "num_threads": num_threads}
+    if delegate == "none":
+        kwargs["experimental_op_resolver_type"] = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    elif delegate != "xnnpack":
+        kwargs["experimental_delegates"] = [load_delegate(delegate)]
+    return Interpreter(**kwargs)
+
+
+def _get_interpreter():
+    """Loads the occupation classifier on first use."""
+    global interpreter, input_details, output_details, _batch_size
+    if interpreter is None:
+        started = time.perf_counter()
+        model = _build_interpreter(MODEL_PATH, NUM_THREADS, DELEGATE)
+        model.allocate_tensors()
+        input_details = model.get_input_details()
+        output_details = model.get_output_details()
+        _batch_size = 1
+        interpreter = model
+        print(f"Loaded {MODEL_PATH} ({input_details[0]['dtype'].__name__} input, {NUM_THREADS} threads, "
+              f"{DELEGATE}) with {runtime} in {time.perf_counter() - started:.2f}s")
+    return interpreter
+
+
+def configure(variant: str = None, model_path: str = None, num_threads: int = None,
+              delegate: str = None):
+    """
+    Switches model file, thread count or delegate. The interpreter is rebuilt
+    on the next prediction.
+    """
+    global MODEL_PATH, NUM_THREADS, DELEGATE, interpreter
+    with _lock:
+        if variant is not None:
+            MODEL_PATH = MODEL_VARIANTS[variant]
+        if model_path is not None:
+            MODEL_PATH = model_path
+        if num_threads is not None:
+            NUM_THREADS = num_threads
+        if delegate is not None:
+            DELEGATE = delegate
+        interpreter = None
+
+
+def load():
+    """Loads the classifier now instead of on the first prediction."""
+    with _lock:
+        _get_interpreter()
+
+
+def _load(img) -> "np.ndarray | None":
+    """img itself for a BGR array, the decoded image for a path; None if unreadable or empty."""
+    if isinstance(img, (str, os.PathLike)):
+        path, img = str(img), cv2.imread(str(img))
+        if img is None:
+            print(f"Could not read {path}")
+            return None
+    return img if img is not None and img.size else None
+
+
+def _resize(img: np.ndarray) -> np.ndarray:
+    """
+    Resizes to IMG_SIZE. Shrinking uses area averaging, which does not alias
+    and stays close to the antialiased PIL resize the classifier was trained
+    with; cubic is only used to enlarge small crops.
+    """
+    h, w = img.shape[:2]
+    shrinking = w * h >= IMG_SIZE[0] * IMG_SIZE[1]
+    return cv2.resize(img, IMG_SIZE, interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
 
-def predict_person(img_path):
-    """Simulates model prediction by randomly selecting a label."""
-    img = Image.open(img_path).convert("RGB")
-    img = img.resize(IMG_SIZE)
-    img_array = np.array(img, dtype=np.float32) / 255.0  # Normalize
-    img_array = np.expand_dims(img_array, axis=0)
 
-    interpreter.set_tensor(input_details[0]['index'], img_array)
-    interpreter.invoke()
-    predictions = interpreter.get_tensor(output_details[0]['index'])[0]
+def _prepare_batch(images) -> np.ndarray:
+    """Resizes every BGR crop (or image path) to IMG_SIZE and normalises the stack in one step."""
+    loaded = [_load(img) for img in images]
+    if any(img is None for img in loaded):
+        raise ValueError(f"{sum(img is None for img in loaded)} of {len(loaded)} images could not be read")
+    resized = [_resize(img) for img in loaded]
+    batch = np.stack(resized)[..., ::-1]  # BGR -> RGB for the whole batch
+    return batch.astype(np.float32) * (1.0 / 255.0)  # Normalize
+
+
+def _set_batch_size(n: int):
+    """Resizes the interpreter's input tensor when the batch size changes."""
+    global _batch_size, input_details, output_details
+    if n != _batch_size:
+        interpreter.resize_tensor_input(input_details[0]['index'], [n, IMG_SIZE[1], IMG_SIZE[0], 3])
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+        _batch_size = n
+
+
+def _quantize(batch: np.ndarray, detail: dict) -> np.ndarray:
+    """Maps the normalised float batch onto an integer input tensor's scale and zero point."""
+    dtype = detail['dtype']
+    if not np.issubdtype(dtype, np.integer):
+        return batch.astype(dtype, copy=False)  # float32 and float16-weight models take float input
+    scale, zero_point = detail['quantization']
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output: np.ndarray, detail: dict) -> np.ndarray:
+    if not np.issubdtype(detail['dtype'], np.integer):
+        return output.astype(np.float32, copy=False)
+    scale, zero_point = detail['quantization']
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+def _classify(batch: np.ndarray) -> np.ndarray:
+    """Runs the interpreter on a prepared batch; returns (n, len(LABELS)) probabilities."""
+    with _lock:
+        _get_interpreter()
+        _set_batch_size(len(batch))
+        interpreter.set_tensor(input_details[0]['index'], _quantize(batch, input_details[0]))
+        interpreter.invoke()
+        return _dequantize(interpreter.get_tensor(output_details[0]['index']), output_details[0]).copy()
+
+
+def predict_people(images):
+    """
+    Classifies the occupation of every person crop from a frame in one
+    interpreter call. images are BGR arrays (or paths).
+
+    Returns:
+        list[tuple[str, float]]: (label, confidence) per image, in input order;
+        label is UNKNOWN_LABEL below CONFIDENCE_THRESHOLD or for an unreadable image.
+    """
+    if not len(images):
+        return []
+
+    loaded = [_load(img) for img in images]
+    readable = [img for img in loaded if img is not None]
+    if not readable:
+        return [(UNKNOWN_LABEL, 0.0)] * len(loaded)
+    predictions = _classify(_prepare_batch(readable))
+
+    best = np.argmax(predictions, axis=1)
+    confidences = iter(predictions[np.arange(len(best)), best])
+    best = iter(best)
+    results = []
+    for img in loaded:
+        if img is None:
+            results.append((UNKNOWN_LABEL, 0.0))
+            continue
+        i, c = next(best), next(confidences)
+        results.append((LABELS[i] if c >= CONFIDENCE_THRESHOLD else UNKNOWN_LABEL, float(c)))
+    return results
+
+
+def occupation_alert(labels) -> "str | None":
+    """Alert text for the recognised occupations in labels, or None if there are none."""
+    occupations = [label for label in labels if label != UNKNOWN_LABEL]
+    if not occupations:
+        return None
+    if len(occupations) == 1:
+        return f"Unknown visitor! Identified as a {occupations[0]}."
+    return f"Unknown visitors! Identified as: {', '.join(occupations)}."
+
+
+def predict_person(image):
+    """
+    Classifies a visitor's occupation from a BGR image array (or an image path).
+    Array inputs, including crops that are views into a larger frame, are used
+    in place and never touch the disk.
+    """
+    image = _load(image)
+    if image is None:
+        print(f"Final Prediction: {UNKNOWN_LABEL}")
+        return UNKNOWN_LABEL
+    predictions = _classify(_prepare_batch([image]))[0]
 
     best_idx = np.argmax(predictions)
     confidence = predictions[best_idx]
     if confidence < CONFIDENCE_THRESHOLD:
-        prediction = "Unknown"
+        prediction = UNKNOWN_LABEL
     else:
         prediction = LABELS[best_idx]
 
@@ -37,7 +244,4 @@ def predict_person(img_path):
     for i, label in enumerate(LABELS):
         print(f"{label}: {predictions[i]*100:.2f}%")
     print(f"Final Prediction: {prediction}")
-
-    os.remove(img_path)
     return prediction
-  
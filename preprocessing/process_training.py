@@ -2,10 +2,29 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import argparse
+import json
 import os
+import sys
 import time
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Shared with the live pipeline in outline/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "outline"))
+from feature_cache import FeatureCache, file_digest
+from preprocess import FACE_CHIP_SIZE, chip_from_eyes, mesh_eye_centers
+
+# Bump when the detection/alignment code below changes so cached crops are not reused
+PREPROCESS_VERSION = 2
+CACHE_TAG = f"mediapipe-align-v{PREPROCESS_VERSION}"
+
+SUPPORTED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+MANIFEST_NAME = "manifest.jsonl"
+
+# Per-process MediaPipe models, built once by _init_models()
+_face_detection = None
+_face_mesh = None
+# Per-process crop cache, so its size is measured once rather than on every put
+_cache = None
 
 
 def save_image(image: np.ndarray, directory: str, prefix: str):
@@ -21,103 +40,189 @@ def save_image(image: np.ndarray, directory: str, prefix: str):
     return None
 
 
+def _init_models(cache_dir: str = None):
+    """
+    Builds this process's FaceDetection / FaceMesh and, with cache_dir, its
+    FeatureCache once; used as the pool initializer.
+    """
+    global _face_detection, _face_mesh, _cache
+    if _face_detection is None:
+        _face_detection = mp.solutions.face_detection.FaceDetection(min_detection_confidence=0.5)
+        _face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1)
+    if cache_dir and (_cache is None or _cache.root != cache_dir):
+        _cache = FeatureCache(CACHE_TAG, root=cache_dir)
+
+
 def process_face_image(image):
     """
     Detects and aligns a face using MediaPipe Face Detection and Face Mesh.
-    
+    FaceMesh runs on the detected face region only and the region is warped
+    straight into a FACE_CHIP_SIZE chip, with no second detection pass.
+
     Returns:
-        np.ndarray: Cropped and aligned face image path, or None if no face is detected.
+        np.ndarray: Cropped and aligned face image, or None if no face is detected.
     """
     rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    mp_face_detection = mp.solutions.face_detection
-    mp_face_mesh = mp.solutions.face_mesh
-
-    with mp_face_detection.FaceDetection(min_detection_confidence=0.5) as face_detection, \
-         mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1) as face_mesh:
-        
-        results = face_detection.process(rgb_image)
-
-        if results.detections:
-            mesh_results = face_mesh.process(rgb_image)
-
-            if mesh_results.multi_face_landmarks:
-                for face_landmarks in mesh_results.multi_face_landmarks:
-                    left_eye = face_landmarks.landmark[33]
-                    right_eye = face_landmarks.landmark[263]
-
-                    h, w, _ = image.shape
-                    left_eye_coords = (int(left_eye.x * w), int(left_eye.y * h))
-                    right_eye_coords = (int(right_eye.x * w), int(right_eye.y * h))
-
-                    delta_y = right_eye_coords[1] - left_eye_coords[1]
-                    delta_x = right_eye_coords[0] - left_eye_coords[0]
-                    angle = np.degrees(np.arctan2(delta_y, delta_x))
-
-                    center = (w // 2, h // 2)
-                    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-                    rotated_image = cv2.warpAffine(image, rotation_matrix, (w, h))
-
-                    rotated_rgb_image = cv2.cvtColor(rotated_image, cv2.COLOR_BGR2RGB)
-                    rotated_results = face_detection.process(rotated_rgb_image)
-
-                    if rotated_results.detections:
-                        for rotated_detection in rotated_results.detections:
-                            bbox = rotated_detection.location_data.relative_bounding_box
-                            x, y, w_box, h_box = (
-                                max(0, int(bbox.xmin * w)),
-                                max(0, int(bbox.ymin * h)),
-                                min(w, int(bbox.width * w)),
-                                min(h, int(bbox.height * h))
-                            )
-
-                            cropped_face = rotated_image[y:y + h_box, x:x + w_box]
-                            if cropped_face.size > 0:
-                                return save_image(cropped_face, "faces", "face")
-                    print("Face not detected in rotated image.")
-        else:
-            print("No face detected.")
-    return None
+    _init_models()
+    results = _face_detection.process(rgb_image)
+    if not results.detections:
+        print("No face detected.")
+        return None
+
+    h, w, _ = image.shape
+    detection = max(results.detections, key=lambda d: d.score[0])
+    bbox = detection.location_data.relative_bounding_box
+    x0, y0 = max(0, int(bbox.xmin * w)), max(0, int(bbox.ymin * h))
+    x1, y1 = min(w, int((bbox.xmin + bbox.width) * w)), min(h, int((bbox.ymin + bbox.height) * h))
+    if x1 <= x0 or y1 <= y0:
+        print("No face detected.")
+        return None
+    box = (x0, y0, x1 - x0, y1 - y0)
+
+    eyes = mesh_eye_centers(rgb_image, box, face_mesh=_face_mesh)
+    if eyes is None:
+        keypoints = detection.location_data.relative_keypoints
+        if len(keypoints) < 2:
+            print("Face landmarks not detected.")
+            return None
+        eyes = tuple((kp.x * w, kp.y * h) for kp in keypoints[:2])
+    return chip_from_eyes(image, box, eyes, FACE_CHIP_SIZE)
 
 
 def process_and_save_face(image, output_dir, prefix):
     """
     Wrapper to process face and save to a specified directory with a custom prefix.
+    The aligned crop is written straight to output_dir.
     """
-    result_path = process_face_image(image)
-    if result_path:
-        result_image = cv2.imread(result_path)
-        return save_image(result_image, output_dir, prefix)
+    cropped_face = process_face_image(image)
+    if cropped_face is not None:
+        return save_image(cropped_face, output_dir, prefix)
     return None
 
 
-def batch_process_faces(input_dir: str, output_dir: str):
-    """
-    Processes all image files in a directory and saves cropped face images to output directory.
+def _process_file(image_path: str, output_dir: str, cache_dir: str = None):
     """
-    supported_extensions = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
-    os.makedirs(output_dir, exist_ok=True)
+    Processes one source image (runs inside a pool worker). With cache_dir set,
+    aligned crops are looked up by the source file's content hash first, and
+    images known to have no face are not decoded at all.
 
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith(supported_extensions):
-            image_path = os.path.join(input_dir, filename)
+    Returns:
+        dict: Manifest record with source, status ("ok", "no_face" or "failed") and output.
+    """
+    filename = os.path.basename(image_path)
+    prefix = os.path.splitext(filename)[0]
+    record = {"source": filename, "status": "failed", "output": None}
+    try:
+        _init_models(cache_dir)
+        cache = _cache if cache_dir else None
+        digest = file_digest(image_path) if cache else None
+        entry = cache.get(digest) if cache else None
+
+        if entry is not None:
+            cropped_face = entry["crop"] if entry["crop"].size else None
+        else:
             image = cv2.imread(image_path)
             if image is None:
                 print(f"Warning: Failed to load {filename}")
-                continue
+                return record
+            cropped_face = process_face_image(image)
+            if cache:
+                empty = np.empty((0, 0, 3), dtype=np.uint8)
+                cache.put(digest, crop=cropped_face if cropped_face is not None else empty)
+
+        output = save_image(cropped_face, output_dir, prefix) if cropped_face is not None else None
+        record["status"] = "ok" if output else "no_face"
+        record["output"] = output
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+    return record
+
+
+def load_manifest(output_dir: str) -> dict:
+    """Reads output_dir's manifest as {source filename: latest record}."""
+    records = {}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line from an interrupted run
+                records[record["source"]] = record
+    return records
+
+
+def batch_process_faces(input_dir: str, output_dir: str, workers: int = None, resume: bool = True,
+                        cache_dir: str = None):
+    """
+    Processes all image files in a directory and saves cropped face images to output directory.
 
-            print(f"Processing {filename}...")
-            processed_path = process_and_save_face(image, output_dir, os.path.splitext(filename)[0])
-            if processed_path is None:
-                print(f"No face detected in {filename}")
-        else:
+    Work is spread over a process pool (one set of MediaPipe models per worker).
+    Every finished image is appended to output_dir/manifest.jsonl, so an
+    interrupted run picks up where it left off; images that failed are retried.
+    With cache_dir, aligned crops are reused across runs and output directories
+    for every source image whose bytes are unchanged.
+
+    Returns:
+        dict: Summary with processed, ok, no_face, failed, skipped, seconds and images_per_sec.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    done = load_manifest(output_dir) if resume else {}
+
+    todo = []
+    skipped = 0
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
             print(f"Skipping unsupported file {filename}")
+            continue
+        if done.get(filename, {}).get("status") in ("ok", "no_face"):
+            skipped += 1
+            continue
+        todo.append(os.path.join(input_dir, filename))
+
+    counts = {"ok": 0, "no_face": 0, "failed": 0}
+    started = time.perf_counter()
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "a" if resume else "w") as manifest:
+        def record(result):
+            counts[result["status"]] += 1
+            manifest.write(json.dumps(result) + "\n")
+            manifest.flush()
+            if result["status"] == "no_face":
+                print(f"No face detected in {result['source']}")
+
+        if workers == 1:
+            for image_path in todo:
+                print(f"Processing {os.path.basename(image_path)}...")
+                record(_process_file(image_path, output_dir, cache_dir))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_models,
+                                     initargs=(cache_dir,)) as pool:
+                futures = [pool.submit(_process_file, path, output_dir, cache_dir) for path in todo]
+                for future in as_completed(futures):
+                    record(future.result())
+
+    elapsed = time.perf_counter() - started
+    processed = sum(counts.values())
+    summary = dict(counts, processed=processed, skipped=skipped, seconds=round(elapsed, 2),
+                   images_per_sec=round(processed / elapsed, 2) if elapsed > 0 else 0.0)
+    print(f"Processed {processed} images in {elapsed:.1f}s ({summary['images_per_sec']} images/sec): "
+          f"{counts['ok']} ok, {counts['no_face']} no face, {counts['failed']} failed, "
+          f"{skipped} already done")
+    return summary
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_dir', type=str, required=True, help='Directory containing images to process.')
     parser.add_argument('--output_dir', type=str, required=True, help='Directory to save processed face images.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count, 1 = serial).')
+    parser.add_argument('--no-resume', action='store_true', help='Ignore the manifest and reprocess everything.')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Content-addressed crop cache to reuse between runs.')
     args = parser.parse_args()
 
-    batch_process_faces(args.input_dir, args.output_dir)
\ No newline at end of file
+    batch_process_faces(args.input_dir, args.output_dir, workers=args.workers, resume=not args.no_resume,
+                        cache_dir=args.cache_dir)